@@ -3,6 +3,7 @@ import path from 'path';
 import * as XLSX from 'xlsx';
 import dotenv from 'dotenv';
 import { parseBoqFile, priceBoq } from '../src/services/boqService.js';
+import { stopWorker } from '../src/services/pricingWorker.js';
 
 dotenv.config();
 
@@ -22,7 +23,7 @@ for (const file of files) {
   }
   try {
     const items = parseBoqFile(abs);
-    const result = priceBoq(items, RATE_FILE);
+    const result = await priceBoq(items, RATE_FILE);
 
     const wb = XLSX.utils.book_new();
     const ws = XLSX.utils.json_to_sheet(result.items);
@@ -34,3 +35,5 @@ for (const file of files) {
     console.error(`Failed to process ${file}:`, err.message);
   }
 }
+
+stopWorker();
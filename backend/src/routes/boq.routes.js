@@ -2,12 +2,15 @@ import { Router } from 'express';
 import multer from 'multer';
 import fs from 'fs';
 import path from 'path';
+import { once } from 'events';
+import readline from 'readline';
 import {
   importBluebeam,
   measurementsToBoq,
   parseBoqFile,
   mergeBoq,
   priceBoq,
+  streamPriceBoq,
 } from '../services/boqService.js';
 import { getProjectFolder, addAddendum, addBoqFile } from '../services/inquiryService.js';
 
@@ -116,12 +119,42 @@ router.post('/price', async (req, res) => {
     }
     const rateFile = process.env.RATE_FILE;
     if (!rateFile) throw new Error('RATE_FILE not configured');
-    const result = priceBoq(items, rateFile);
+    const result = await priceBoq(items, rateFile);
     res.json(result);
   } catch (err) {
     res.status(400).json({ message: err.message });
   }
 });
 
+// Yields the JSON value on each non-empty line of a request body
+async function* readJsonLines(stream) {
+  for await (const line of readline.createInterface({ input: stream, crlfDelay: Infinity })) {
+    if (line.trim()) yield JSON.parse(line);
+  }
+}
+
+// Price BoQ items and stream them back as JSON lines, then a totals line.
+// Send the items as a JSON body { items: [...] }, or as an
+// application/x-ndjson body of one item per line to have them priced while
+// the upload is still arriving.
+router.post('/price/stream', async (req, res) => {
+  const ndjson = req.is('application/x-ndjson');
+  const items = ndjson ? readJsonLines(req) : (req.body || {}).items;
+  if (!ndjson && !Array.isArray(items)) {
+    return res.status(400).json({ message: 'Items must be an array' });
+  }
+  const rateFile = process.env.RATE_FILE;
+  if (!rateFile) return res.status(400).json({ message: 'RATE_FILE not configured' });
+  res.type('application/x-ndjson');
+  try {
+    const summary = await streamPriceBoq(items, rateFile, async item => {
+      if (!res.write(JSON.stringify({ item }) + '\n')) await once(res, 'drain');
+    });
+    res.end(JSON.stringify(summary) + '\n');
+  } catch (err) {
+    res.end(JSON.stringify({ error: err.message }) + '\n');
+  }
+});
+
 
 export default router;
\ No newline at end of file
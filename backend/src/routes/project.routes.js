@@ -162,7 +162,7 @@ router.get('/:id/boq', async (req, res) => {
 
     const items = parseBoqFile(filePath);
     const rateFile = process.env.RATE_FILE;
-    const result = rateFile ? priceBoq(items, rateFile) : { items };
+    const result = rateFile ? await priceBoq(items, rateFile) : { items };
     res.json(result);
   } catch (err) {
     res.status(400).json({ message: err.message });
@@ -184,7 +184,7 @@ router.post('/:id/price', async (req, res) => {
     const items = parseBoqFile(filePath);
     const rateFile = process.env.RATE_FILE;
     if (!rateFile) throw new Error('RATE_FILE not configured');
-    const result = priceBoq(items, rateFile);
+    const result = await priceBoq(items, rateFile);
 
     savePricingResult(folder, result);
 
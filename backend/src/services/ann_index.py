@@ -0,0 +1,180 @@
+"""ann_index.py
+Inverted-file (IVF) approximate nearest-neighbour index in plain NumPy.
+
+Unit embeddings are clustered with spherical k-means; a query only scans the
+price items in its ``nprobe`` closest clusters. The index is persisted next to
+the memory-mapped embedding store (``unit-*.ivf.npz``) and rebuilt when the
+store changes. Run this module on a store file to measure recall@k and latency
+against the exact search, e.g.::
+
+    python ann_index.py ~/.cache/mjd/embeddings/<model>/unit-<hash>.npy --k 10
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from topk_search import select_topk, topk_similarity
+
+ANN_NPROBE = 8            # Clusters scanned per query
+ANN_KMEANS_ITERATIONS = 10
+ANN_TRAIN_SAMPLE = 50000  # Rows used to train the cluster centroids
+
+
+def default_nlist(n: int) -> int:
+    """Return the cluster count for ``n`` rows (about 4 * sqrt(n))."""
+    return max(1, min(n, int(4 * np.sqrt(n))))
+
+
+class IVFIndex:
+    """Cluster centroids plus the row ids of each cluster, stored contiguously."""
+
+    def __init__(self, centroids: np.ndarray, ids: np.ndarray, offsets: np.ndarray):
+        self.centroids = centroids
+        self.ids = ids
+        self.offsets = offsets
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, vectors, nlist: int = None, iterations: int = ANN_KMEANS_ITERATIONS,
+              seed: int = 0):
+        """Cluster the unit rows of ``vectors`` with spherical k-means."""
+        n = len(vectors)
+        nlist = nlist or default_nlist(n)
+        rng = np.random.default_rng(seed)
+        train_rows = np.sort(rng.choice(n, size=min(n, ANN_TRAIN_SAMPLE), replace=False))
+        train = np.asarray(vectors[train_rows], dtype=np.float32)
+        centroids = train[rng.choice(len(train), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign, _ = topk_similarity(train, centroids, 1)
+            assign = assign[:, 0]
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, train)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Reseed empty clusters from random training rows
+            sums[empty] = train[rng.choice(len(train), size=int(empty.sum()))]
+            norms[empty] = 1
+            centroids = sums / norms
+        assign, _ = topk_similarity(vectors, centroids, 1)
+        assign = assign[:, 0]
+        ids = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[ids], np.arange(nlist + 1))
+        return cls(centroids.astype(np.float32), ids.astype(np.int64), offsets.astype(np.int64))
+
+    def save(self, path: str) -> None:
+        tmp_path = path[:-4] + f".{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, ids=self.ids, offsets=self.offsets)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data["centroids"], data["ids"], data["offsets"])
+
+    def search(self, queries, vectors, k: int, nprobe: int = ANN_NPROBE) -> tuple:
+        """Return ``(indices, scores)`` of the approximate k best rows per query.
+
+        Rows are ordered best first. Queries whose probed clusters hold fewer
+        than ``k`` rows are padded with index -1 and score -inf; queries whose
+        probed clusters are all empty (clusters can end up empty after the
+        final assignment) are searched exactly instead.
+        """
+        n = len(queries)
+        indices = np.full((n, k), -1, dtype=np.int64)
+        scores = np.full((n, k), -np.inf, dtype=np.float32)
+        probes, _ = topk_similarity(queries, self.centroids, min(nprobe, self.nlist))
+        for qi in range(n):
+            cands = np.concatenate(
+                [self.ids[self.offsets[c]:self.offsets[c + 1]] for c in probes[qi]]
+            )
+            if not len(cands):
+                continue
+            cands.sort()
+            sims = np.asarray(vectors[cands] @ queries[qi], dtype=np.float32)[None, :]
+            top, top_sims = select_topk(sims, k)
+            indices[qi, : top.shape[1]] = cands[top[0]]
+            scores[qi, : top.shape[1]] = top_sims[0]
+        empty = np.flatnonzero(indices[:, 0] < 0)
+        if len(empty):
+            exact, exact_sims = topk_similarity(queries[empty], vectors, k)
+            indices[empty, : exact.shape[1]] = exact
+            scores[empty, : exact.shape[1]] = exact_sims
+        return indices, scores
+
+
+def index_path(unit_matrix) -> str:
+    """Return the index file stored next to a memory-mapped embedding store."""
+    return unit_matrix.filename[: -len(".npy")] + ".ivf.npz"
+
+
+def load_or_build_index(unit_matrix, logger_fn) -> IVFIndex:
+    """Return the IVF index for a store opened by ``embedding_store``."""
+    path = index_path(unit_matrix)
+    if os.path.exists(path):
+        logger_fn(f"Opened ANN index {os.path.basename(path)}.")
+        return IVFIndex.load(path)
+    logger_fn("Building ANN index for pricelist embeddings...")
+    index = IVFIndex.build(unit_matrix)
+    index.save(path)
+    logger_fn(f"Wrote ANN index {os.path.basename(path)} ({index.nlist} clusters).")
+    return index
+
+
+def recall_at_k(index: IVFIndex, queries, vectors, k: int, nprobe: int) -> dict:
+    """Compare the index against exact search for ``queries``.
+
+    Returns recall@k (share of the exact top-k found), top-1 agreement and the
+    wall time of both searches.
+    """
+    start = time.perf_counter()
+    exact, _ = topk_similarity(queries, vectors, k)
+    exact_s = time.perf_counter() - start
+    start = time.perf_counter()
+    approx, _ = index.search(queries, vectors, k, nprobe)
+    approx_s = time.perf_counter() - start
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact, approx))
+    return {
+        "nprobe": nprobe,
+        "recall": hits / exact.size,
+        "top1": float(np.mean(exact[:, 0] == approx[:, 0])),
+        "exact_s": exact_s,
+        "ann_s": approx_s,
+    }
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark ANN recall@k against exact search.")
+    parser.add_argument("store", help="unit-*.npy embedding store")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=1000,
+                        help="store rows, perturbed with noise, used as queries")
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    vectors = np.load(args.store, mmap_mode="r")
+    index = load_or_build_index(vectors, print)
+    rng = np.random.default_rng(1)
+    rows = np.sort(rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False))
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+    queries += rng.normal(scale=args.noise / np.sqrt(vectors.shape[1]), size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"{len(vectors)} rows, {index.nlist} clusters, {len(queries)} queries, k={args.k}")
+    print("nprobe  recall@k  top1   exact_s  ann_s")
+    for nprobe in args.nprobe:
+        r = recall_at_k(index, queries, vectors, args.k, nprobe)
+        print(f"{r['nprobe']:>6}  {r['recall']:.4f}    {r['top1']:.3f}  "
+              f"{r['exact_s']:.3f}    {r['ann_s']:.3f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
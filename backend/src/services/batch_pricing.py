@@ -0,0 +1,180 @@
+"""batch_pricing.py
+Headless batch pricing of inquiry workbooks with the embedding matchers.
+
+Loads the price list and its embeddings once, then prices every inquiry on a
+thread pool (embedding calls are network-bound and the scoring runs in
+numpy), writing each result to ``<out>/<name>_priced.xlsx``::
+
+    python batch_pricing.py --matcher cohere --out priced/ inquiries/ "tenders/*.xlsx"
+    python batch_pricing.py --matcher qwen --pricelist prices.xlsx --out priced/ inq.xlsx
+
+API keys come from ``COHERE_API_KEY`` / ``OPENAI_API_KEY`` and the database
+price list from ``CONNECTION_STRING``, as in the Tkinter apps. Existing
+outputs are skipped unless ``--overwrite`` is given, so an interrupted run
+can be resumed. :func:`price_inquiries` is the library entry point.
+
+The pricematch/v2 app is not offered as a matcher: its module shares the name
+``coherepricematcher`` with the backend matcher, and it prices from a
+pricelist workbook with taxonomy and fuzzy options in one
+``fill_inquiry_rates`` call rather than the ``prepare_pricelist`` /
+``match_inquiry`` split the batch runner shares across inquiries.
+"""
+
+import glob
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from inquiry_io import write_inquiry
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))  # Inquiries priced concurrently
+
+
+def find_inquiries(patterns: list) -> list:
+    """Expand directories (their ``*.xlsx``) and glob patterns into workbook paths."""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(pattern, "*.xlsx"))
+        else:
+            matches = glob.glob(pattern) or [pattern]
+        # Skip Excel's lock files for workbooks open elsewhere
+        paths.extend(sorted(p for p in matches if not os.path.basename(p).startswith("~$")))
+    return list(dict.fromkeys(os.path.abspath(p) for p in paths))
+
+
+def output_path(inquiry_path: str, output_dir: str) -> str:
+    stem = os.path.splitext(os.path.basename(inquiry_path))[0]
+    return os.path.join(output_dir, f"{stem}_priced.xlsx")
+
+
+def price_inquiries(matcher, provider, pricelist: dict, inquiry_paths: list, output_dir: str,
+                    logger_fn, workers: int = BATCH_WORKERS, overwrite: bool = False) -> list:
+    """Price each inquiry against a prepared pricelist; return ``(path, output, error)`` per file.
+
+    ``matcher`` is a matcher module (``coherepricematcher``, ``openaipricematcher``
+    or ``quinpricematcher``) and ``pricelist`` its ``prepare_pricelist`` result.
+    A failing inquiry is logged and reported without stopping the others.
+    """
+    outputs = [output_path(p, output_dir) for p in inquiry_paths]
+    if len(set(outputs)) != len(outputs):
+        raise RuntimeError("Inquiry file names must be unique; outputs would overwrite each other.")
+    os.makedirs(output_dir, exist_ok=True)
+
+    def run(path):
+        name = os.path.basename(path)
+        out = output_path(path, output_dir)
+
+        def log(msg):
+            logger_fn(f"[{name}] {msg}")
+
+        if os.path.exists(out) and not overwrite:
+            log(f"Skipping, {out} exists.")
+            return path, out, None
+        try:
+            start = time.perf_counter()
+            items_to_fill, header_rows = matcher.load_inquiry_data(path, log)
+            cells = matcher.match_inquiry(provider, pricelist, items_to_fill, header_rows, log)
+            write_inquiry(path, out, cells, log)
+            log(f"Priced {len(items_to_fill)} items in {time.perf_counter() - start:.1f}s.")
+            return path, out, None
+        except Exception as e:
+            log(f"Error: {e}")
+            return path, None, str(e) or e.__class__.__name__
+
+    if workers <= 1 or len(inquiry_paths) <= 1:
+        return [run(p) for p in inquiry_paths]
+    with ThreadPoolExecutor(max_workers=min(workers, len(inquiry_paths))) as pool:
+        return list(pool.map(run, inquiry_paths))
+
+
+def load_matcher(name: str, pricelist_path: str, logger_fn) -> tuple:
+    """Return ``(matcher module, provider, pricelist descs, rates)`` for a matcher name."""
+    if name == "cohere":
+        import cohere
+
+        import coherepricematcher as matcher
+        from embedding_providers import CohereProvider
+
+        provider = CohereProvider(cohere.ClientV2(api_key=_env("COHERE_API_KEY")),
+                                  matcher.EMBEDDING_MODEL, matcher.EMBEDDING_DIMENSION,
+                                  matcher.EMBEDDING_BATCH_SIZE)
+        descs, rates = matcher.load_pricelist_from_db(logger_fn)
+    elif name == "openai":
+        import openai
+
+        import openaipricematcher as matcher
+        from embedding_providers import OpenAIProvider
+
+        openai.api_key = _env("OPENAI_API_KEY")
+        provider = OpenAIProvider(matcher.EMBEDDING_MODEL, batch_size=matcher.EMBEDDING_BATCH_SIZE)
+        descs, rates = matcher.load_pricelist_from_db(logger_fn)
+    elif name == "qwen":
+        import quinpricematcher as matcher
+        from local_models import local_provider
+
+        if not pricelist_path:
+            raise RuntimeError("The qwen matcher needs --pricelist.")
+        truncate_dim = matcher.EMBEDDING_DIMENSION if matcher.EMBEDDING_TRUNCATE else None
+        provider = local_provider(matcher.EMBEDDING_MODEL, matcher.EMBEDDING_QUANTIZE, truncate_dim,
+                                  matcher.EMBEDDING_DIMENSION, matcher.EMBEDDING_BATCH_SIZE, logger_fn)
+        descs, rates = matcher.load_pricelist_data(pricelist_path, logger_fn)
+    else:
+        raise RuntimeError(f"Unknown matcher: {name}")
+    return matcher, provider, descs, rates
+
+
+def _env(name: str) -> str:
+    value = os.getenv(name, "").strip()
+    if not value:
+        raise RuntimeError(f"{name} environment variable not set")
+    return value
+
+
+def main() -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Price inquiry workbooks without the GUI.")
+    parser.add_argument("inquiries", nargs="+", help="inquiry workbooks, directories or glob patterns")
+    parser.add_argument("--matcher", choices=["cohere", "openai", "qwen"], default="cohere")
+    parser.add_argument("--out", required=True, help="output directory")
+    parser.add_argument("--pricelist", help="pricelist workbook (qwen matcher)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--overwrite", action="store_true", help="re-price existing outputs")
+    args = parser.parse_args()
+
+    write_lock = threading.Lock()
+
+    def log(msg):
+        with write_lock:
+            print(msg, file=sys.stderr, flush=True)
+
+    paths = find_inquiries(args.inquiries)
+    if not paths:
+        log("No inquiry workbooks found.")
+        return 1
+    try:
+        matcher, provider, descs, rates = load_matcher(args.matcher, args.pricelist, log)
+        pricelist = matcher.prepare_pricelist(provider, descs, rates, log)
+    except Exception as e:
+        log(f"Error: {e}")
+        return 1
+    log(f"Pricing {len(paths)} inquiries on {min(args.workers, len(paths))} workers...")
+    results = price_inquiries(matcher, provider, pricelist, paths, args.out, log,
+                              args.workers, args.overwrite)
+    memo = getattr(matcher, "preprocess_text", None)
+    if hasattr(memo, "flush"):
+        memo.flush()
+        log(memo.stats_line())
+    log(provider.metrics_line())
+    failed = [(path, error) for path, _, error in results if error]
+    log(f"{len(results) - len(failed)} priced, {len(failed)} failed.")
+    for path, error in failed:
+        log(f"  {path}: {error}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
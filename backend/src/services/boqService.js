@@ -2,9 +2,12 @@
 // Handles BoQ parsing, merging and pricing
 
 import path from 'path';
-import { spawnSync } from 'child_process';
 import XLSX from 'xlsx';
 import { parseCSV, parseXML } from './bluebeamParser.js';
+import { callWorker } from './pricingWorker.js';
+
+// BoQ items per worker call when streaming prices back
+const STREAM_BATCH_SIZE = Number(process.env.PRICE_STREAM_BATCH_SIZE) || 200;
 
 export function parseBoqFile(filePath) {
   const wb = XLSX.readFile(filePath);
@@ -68,14 +71,44 @@ export async function importBluebeam(filePath) {
 }
 
 
-export function priceBoq(items, rateFile) {
-  const script = path.resolve('backend/src/services/pricing_engine.py');
-  const proc = spawnSync('python3', [script, rateFile], {
-    input: JSON.stringify(items),
-    encoding: 'utf8',
-  });
-  if (proc.status !== 0) {
-    throw new Error(proc.stderr || 'Pricing engine failed');
+export async function priceBoq(items, rateFile) {
+  return callWorker('price', { rate_file: path.resolve(rateFile), items });
+}
+
+// Prices items on the warm pricing worker in batches of STREAM_BATCH_SIZE,
+// calling onItem with each priced item as its batch comes back; the next
+// batch is already being priced meanwhile. items may be an array or an async
+// iterable (e.g. a JSON-lines request body). Resolves with { total, overrides }.
+export async function streamPriceBoq(items, rateFile, onItem) {
+  const rate_file = path.resolve(rateFile);
+  let total = 0;
+  const overrides = [];
+  let inFlight = null;
+
+  const emit = async () => {
+    const result = await inFlight;
+    inFlight = null;
+    for (const item of result.items) await onItem(item);
+    total += result.total;
+    overrides.push(...result.overrides);
+  };
+  const send = async batch => {
+    const call = callWorker('price', { rate_file, items: batch });
+    // Handled when awaited in emit(); don't report it as unhandled meanwhile
+    call.catch(() => {});
+    if (inFlight) await emit();
+    inFlight = call;
+  };
+
+  let batch = [];
+  for await (const item of items) {
+    batch.push(item);
+    if (batch.length >= STREAM_BATCH_SIZE) {
+      await send(batch);
+      batch = [];
+    }
   }
-  return JSON.parse(proc.stdout);
-}
\ No newline at end of file
+  if (batch.length) await send(batch);
+  if (inFlight) await emit();
+  return { total, overrides };
+}
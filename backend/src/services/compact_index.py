@@ -0,0 +1,245 @@
+"""compact_index.py
+Reduced-precision copies of a price-list embedding store with two-stage search.
+
+The unit rows of an ``embedding_store`` matrix are encoded as
+
+- ``float16``: half precision (2x smaller than float32),
+- ``int8``: per-dimension symmetric scales, one byte per value (4x),
+- ``binary``: one sign bit per value (32x),
+- ``matryoshka``: the first ``dimensions`` values, re-normalized. Matryoshka
+  models (Cohere embed-v4, OpenAI text-embedding-3, Qwen3-Embedding) front-load
+  meaning into the leading dimensions, so a 256-dim prefix of 1536 is scanned
+  with a 6x smaller matrix product and the shortlist is then rescored at full
+  dimension (a cascade).
+
+A search first scans the compact codes for the ``candidates`` best rows per
+query, then rescores only those rows with the full-precision store, which
+stays memory-mapped on disk so the scan never pages it in. Codes are persisted
+next to the store (``unit-*.<kind>.npz``) and rebuilt when the store changes.
+
+``float16``, ``int8`` and ``binary`` reduce memory and disk use only, not
+search time: the scan decodes each block of codes back to float32 for the
+matrix product, and is slightly slower than the exact float32 search. (XOR and
+popcount over packed bits, or an integer matrix product, were several times
+slower again in NumPy, which has no BLAS kernels for them.)
+
+Run this module on a store file for an accuracy and speed report against the
+exact float32 search, e.g.::
+
+    python compact_index.py ~/.cache/mjd/embeddings/<model>/unit-<hash>.npy --k 10
+
+The matryoshka cascade has only been measured on a synthetic store, whose
+vectors have no Matryoshka structure; it has not been run on real pricelist
+embeddings. Run the report above with ``--kinds matryoshka --dimensions 128
+256 512`` on a real store before setting ``EMBEDDING_STORAGE = "matryoshka"``
+in a matcher.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+from embedding_store import normalize_rows
+from topk_search import SEARCH_BLOCK_BYTES, block_rows, select_topk, topk_similarity
+
+COMPACT_KINDS = ("float16", "int8", "binary", "matryoshka")
+CASCADE_DIMENSIONS = 256        # Prefix length scanned by the matryoshka kind
+COMPACT_CANDIDATES = 100        # Rows per query rescored in full precision
+COMPACT_SCAN_ROWS = 16384       # Code rows decoded per block while scanning
+
+
+class CompactIndex:
+    """Compact codes of a unit matrix; ``scale`` holds the int8 per-dimension scales."""
+
+    def __init__(self, kind: str, codes: np.ndarray, dimension: int, scale: np.ndarray = None):
+        if kind not in COMPACT_KINDS:
+            raise RuntimeError(f"Unknown embedding storage: {kind}")
+        self.kind = kind
+        self.codes = codes
+        self.dimension = dimension
+        self.scale = scale
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scale.nbytes if self.scale is not None else 0)
+
+    @classmethod
+    def build(cls, vectors, kind: str, dimensions: int = CASCADE_DIMENSIONS,
+              block: int = COMPACT_SCAN_ROWS):
+        """Encode the unit rows of ``vectors`` (which may be a memory map)."""
+        n, d = vectors.shape
+        scale = None
+        if kind == "matryoshka":
+            d = min(dimensions, d)
+            codes = np.empty((n, d), dtype=np.float32)
+        elif kind == "float16":
+            codes = np.empty((n, d), dtype=np.float16)
+        elif kind == "int8":
+            codes = np.empty((n, d), dtype=np.int8)
+            peak = np.zeros(d, dtype=np.float32)
+            for start in range(0, n, block):
+                np.maximum(peak, np.abs(vectors[start:start + block]).max(axis=0), out=peak)
+            peak[peak == 0] = 1
+            scale = (peak / 127).astype(np.float32)
+        elif kind == "binary":
+            codes = np.empty((n, (d + 7) // 8), dtype=np.uint8)
+        else:
+            raise RuntimeError(f"Unknown embedding storage: {kind}")
+        for start in range(0, n, block):
+            rows = np.asarray(vectors[start:start + block], dtype=np.float32)
+            if kind == "matryoshka":
+                codes[start:start + block] = normalize_rows(rows[:, :d].copy())
+            elif kind == "float16":
+                codes[start:start + block] = rows
+            elif kind == "int8":
+                codes[start:start + block] = np.rint(rows / scale)
+            else:
+                codes[start:start + block] = np.packbits(rows > 0, axis=1)
+        return cls(kind, codes, d, scale)
+
+    def save(self, path: str) -> None:
+        tmp_path = path[:-4] + f".{os.getpid()}.tmp.npz"
+        arrays = {"codes": self.codes, "dimension": np.int64(self.dimension)}
+        if self.scale is not None:
+            arrays["scale"] = self.scale
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, kind: str):
+        with np.load(path) as data:
+            scale = data["scale"] if "scale" in data.files else None
+            return cls(kind, data["codes"], int(data["dimension"]), scale)
+
+    def decode(self, start: int, stop: int) -> np.ndarray:
+        """Return rows ``start:stop`` as float32, in the space the scan scores in."""
+        codes = self.codes[start:stop]
+        if self.kind == "binary":
+            # q . sign(x) = 2 q . bits - sum(q): ranking by q . bits is equivalent
+            return np.unpackbits(codes, axis=1, count=self.dimension).astype(np.float32)
+        return codes.astype(np.float32, copy=False)
+
+    def scan(self, queries, m: int, block: int = COMPACT_SCAN_ROWS,
+             max_bytes: int = SEARCH_BLOCK_BYTES) -> np.ndarray:
+        """Return the indices of the ``m`` best rows per query by compact score."""
+        # A query's own norm does not change its ranking, so the prefix of
+        # a matryoshka query needs no re-normalization
+        queries = np.asarray(queries, dtype=np.float32)[:, :self.dimension]
+        if self.scale is not None:
+            queries = queries * self.scale  # x ~ codes * scale
+        n_rows = len(self.codes)
+        m = min(m, n_rows)
+        indices = np.empty((len(queries), m), dtype=np.int64)
+        step = block_rows(n_rows, 4, max_bytes)
+        for q_start in range(0, len(queries), step):
+            q_block = queries[q_start:q_start + step]
+            scores = np.empty((len(q_block), n_rows), dtype=np.float32)
+            # Decode a block of codes at a time; only one is ever in float32
+            for start in range(0, n_rows, block):
+                stop = min(start + block, n_rows)
+                scores[:, start:stop] = q_block @ self.decode(start, stop).T
+            indices[q_start:q_start + step], _ = select_topk(scores, m)
+        return indices
+
+    def search(self, queries, vectors, k: int, candidates: int = COMPACT_CANDIDATES) -> tuple:
+        """Return ``(indices, scores)`` of the k best rows per query, best first.
+
+        Scores are exact cosines from ``vectors`` (the full-precision unit
+        matrix) for the ``max(k, candidates)`` rows found by the compact scan.
+        """
+        k = min(k, len(self.codes))
+        cands = self.scan(queries, max(k, candidates))
+        indices = np.empty((len(queries), k), dtype=np.int64)
+        scores = np.empty((len(queries), k), dtype=np.float32)
+        for qi in range(len(queries)):
+            rows = np.sort(cands[qi])
+            sims = np.asarray(vectors[rows] @ queries[qi], dtype=np.float32)[None, :]
+            top, top_sims = select_topk(sims, k)
+            indices[qi] = rows[top[0]]
+            scores[qi] = top_sims[0]
+        return indices, scores
+
+
+def compact_path(unit_matrix, kind: str, dimensions: int = CASCADE_DIMENSIONS) -> str:
+    """Return the codes file stored next to a memory-mapped embedding store."""
+    suffix = f"mrl{dimensions}" if kind == "matryoshka" else kind
+    return unit_matrix.filename[: -len(".npy")] + f".{suffix}.npz"
+
+
+def load_or_build_compact(unit_matrix, kind: str, logger_fn,
+                          dimensions: int = CASCADE_DIMENSIONS) -> CompactIndex:
+    """Return the ``kind`` codes for a store opened by ``embedding_store``."""
+    path = compact_path(unit_matrix, kind, dimensions)
+    if os.path.exists(path):
+        logger_fn(f"Opened {kind} embedding codes {os.path.basename(path)}.")
+        return CompactIndex.load(path, kind)
+    logger_fn(f"Encoding pricelist embeddings as {kind}...")
+    index = CompactIndex.build(unit_matrix, kind, dimensions)
+    index.save(path)
+    logger_fn(f"Wrote {kind} embedding codes {os.path.basename(path)} "
+              f"({index.nbytes / 2**20:.1f} MB).")
+    return index
+
+
+def accuracy_report(index: CompactIndex, queries, vectors, k: int, candidates: int) -> dict:
+    """Compare two-stage search over ``index`` with exact float32 search.
+
+    Returns recall@k (share of the exact top-k found), top-1 agreement, the
+    largest top-1 score difference and the wall time of both searches.
+    """
+    start = time.perf_counter()
+    exact, exact_scores = topk_similarity(queries, vectors, k)
+    exact_s = time.perf_counter() - start
+    start = time.perf_counter()
+    approx, approx_scores = index.search(queries, vectors, k, candidates)
+    compact_s = time.perf_counter() - start
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact, approx))
+    return {
+        "kind": index.kind,
+        "ratio": vectors.nbytes / index.nbytes,
+        "recall": hits / exact.size,
+        "top1": float(np.mean(exact[:, 0] == approx[:, 0])),
+        "score_diff": float(np.max(exact_scores[:, 0] - approx_scores[:, 0])),
+        "exact_s": exact_s,
+        "compact_s": compact_s,
+    }
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report compact-code search accuracy against exact search.")
+    parser.add_argument("store", help="unit-*.npy embedding store")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--kinds", nargs="+", choices=COMPACT_KINDS, default=list(COMPACT_KINDS))
+    parser.add_argument("--candidates", type=int, default=COMPACT_CANDIDATES)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[CASCADE_DIMENSIONS],
+                        help="prefix lengths for the matryoshka kind")
+    parser.add_argument("--queries", type=int, default=1000,
+                        help="store rows, perturbed with noise, used as queries")
+    parser.add_argument("--noise", type=float, default=0.05)
+    args = parser.parse_args()
+
+    vectors = np.load(args.store, mmap_mode="r")
+    rng = np.random.default_rng(1)
+    rows = np.sort(rng.choice(len(vectors), size=min(args.queries, len(vectors)), replace=False))
+    queries = np.asarray(vectors[rows], dtype=np.float32)
+    queries += rng.normal(scale=args.noise / np.sqrt(vectors.shape[1]), size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    print(f"{len(vectors)} rows x {vectors.shape[1]}, {len(queries)} queries, k={args.k}, "
+          f"{args.candidates} candidates")
+    print("kind     size   recall@k  top1   max_diff  exact_s  compact_s")
+    for kind in args.kinds:
+        for dims in (args.dimensions if kind == "matryoshka" else [CASCADE_DIMENSIONS]):
+            index = load_or_build_compact(vectors, kind, print, dims)
+            r = accuracy_report(index, queries, vectors, args.k, args.candidates)
+            label = f"mrl{dims}" if kind == "matryoshka" else kind
+            print(f"{label:<8} 1/{r['ratio']:<4.0f} {r['recall']:.4f}    {r['top1']:.3f}  "
+                  f"{r['score_diff']:.5f}   {r['exact_s']:.3f}    {r['compact_s']:.3f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
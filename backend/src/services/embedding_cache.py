@@ -0,0 +1,155 @@
+"""embedding_cache.py
+Content-addressed on-disk cache for description embeddings.
+
+Each (model, dimension) pair gets its own directory holding an append-only
+float32 matrix (``vectors.f32``, opened with ``np.memmap``) and an index file
+mapping the hash of (input_type, preprocessed text) to a matrix row. Only
+texts missing from the index are sent to the embedding provider, each once
+however often it repeats, and every position gets its text's row back.
+
+Several processes may share a cache directory (the GUI apps, batch_pricing,
+the pricing worker). Appends hold an exclusive lock on ``.lock`` and reload
+the index first, so rows another process has indexed are never overwritten;
+a row becomes visible only once the index naming it has been replaced.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+EMBEDDING_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "mjd", "embeddings"),
+)
+
+
+@contextlib.contextmanager
+def _file_lock(path: str):
+    """Hold an exclusive cross-process lock on ``path`` (created if missing)."""
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def text_key(text: str, input_type: str) -> str:
+    """Return the cache key of a preprocessed text for one input type."""
+    return hashlib.sha256(f"{input_type}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Embedding cache for a single model and output dimension."""
+
+    def __init__(self, model: str, dimension=None, root: str = EMBEDDING_CACHE_DIR):
+        self.model = model
+        self.dimension = dimension
+        name = hashlib.sha256(f"{model}\0{dimension}".encode("utf-8")).hexdigest()[:16]
+        self.path = os.path.join(root, name)
+        self.vectors_path = os.path.join(self.path, "vectors.f32")
+        self.index_path = os.path.join(self.path, "index.json")
+        self.lock_path = os.path.join(self.path, ".lock")
+        self._lock = threading.Lock()
+        self.width = None
+        self.index: dict = {}
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                meta = json.load(f)
+            self.width = meta["width"]
+            self.index = meta["rows"]
+
+    def __len__(self):
+        return len(self.index)
+
+    def _vectors(self):
+        return np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.index), self.width)
+        )
+
+    def lookup(self, texts: list, input_type: str) -> tuple:
+        """Return ``(rows, missing)`` for ``texts``.
+
+        ``rows`` holds each text's matrix row or -1, ``missing`` the positions
+        of texts that still need embedding.
+        """
+        rows = np.array(
+            [self.index.get(text_key(t, input_type), -1) for t in texts], dtype=np.int64
+        )
+        return rows, np.flatnonzero(rows < 0)
+
+    def add(self, texts: list, input_type: str, vectors) -> None:
+        """Append embeddings for ``texts`` and persist the index."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(texts):
+            return
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, _file_lock(self.lock_path):
+            # Pick up rows other processes appended since this index was read
+            self._load_index()
+            if self.width is None:
+                self.width = vectors.shape[1]
+            elif vectors.shape[1] != self.width:
+                raise RuntimeError(
+                    f"Embedding width {vectors.shape[1]} does not match cache width {self.width}."
+                )
+            # Drop unindexed rows left behind by an interrupted write; every
+            # indexed row (from any process) is kept
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(len(self.index) * self.width * 4)
+                f.seek(0, os.SEEK_END)
+                for text, vec in zip(texts, vectors):
+                    key = text_key(text, input_type)
+                    if key in self.index:
+                        continue
+                    f.write(vec.tobytes())
+                    self.index[key] = len(self.index)
+            tmp_path = self.index_path + f".{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {"model": self.model, "dimension": self.dimension,
+                     "width": self.width, "rows": self.index},
+                    f,
+                )
+            os.replace(tmp_path, self.index_path)
+
+    def get(self, texts: list, input_type: str, embed_fn, logger_fn=None) -> np.ndarray:
+        """Return float32 embeddings for ``texts``, embedding only cache misses.
+
+        ``embed_fn`` receives the distinct missing texts and returns their
+        embeddings in the same order; duplicates share one embedding.
+        """
+        rows, missing = self.lookup(texts, input_type)
+        missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+        if logger_fn:
+            logger_fn(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses "
+                      f"({len(missing_texts)} distinct).")
+        if missing_texts:
+            self.add(missing_texts, input_type, embed_fn(missing_texts))
+            rows, _ = self.lookup(texts, input_type)
+        if not len(rows):
+            return np.empty((0, self.width or 0), dtype=np.float32)
+        # Not while another thread is appending rows
+        with self._lock:
+            return np.asarray(self._vectors()[rows])
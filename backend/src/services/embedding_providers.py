@@ -0,0 +1,259 @@
+"""embedding_providers.py
+One embedding pipeline shared by every matcher, with pluggable backends.
+
+:class:`EmbeddingProvider` splits texts into batches, sends them through
+``embedding_scheduler.embed_batches`` (concurrency, pacing, rate-limit
+retries) for remote backends, serves repeats from ``EmbeddingCache`` and
+counts requests, texts and time spent. Backends only implement
+:meth:`EmbeddingProvider.embed_batch`:
+
+- :class:`CohereProvider`: a ``cohere.ClientV2`` (``input_type`` aware).
+- :class:`OpenAIProvider`: the ``openai`` client (no input types).
+- :class:`SentenceTransformerProvider`: a local model with query/passage prefixes,
+  batched by token length within a memory budget (see local_models).
+- :class:`FakeProvider`: deterministic hash vectors, optionally via
+  ``fake_embedding_server``, for tests and benchmarks.
+
+``python embedding_providers.py --benchmark [fake cohere openai qwen]`` times
+the backends side by side.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from embedding_scheduler import (EMBEDDING_CONCURRENCY, EMBEDDING_REQUESTS_PER_SECOND, TokenBucket,
+                                 embed_batches)
+from embedding_store import load_unit_embeddings
+from fake_embedding_server import embed_texts, fake_embedding
+from local_models import LOCAL_EMBEDDING_MEMORY_MB, activation_bytes, length_buckets, token_lengths
+
+
+class EmbeddingProvider:
+    """Batching, scheduling, caching and metrics around ``embed_batch``."""
+
+    label = "embedding"
+    remote = True         # Remote backends go through the rate-limited scheduler
+    input_types = True    # False when queries and documents embed alike
+    concurrency = EMBEDDING_CONCURRENCY
+    requests_per_second = EMBEDDING_REQUESTS_PER_SECOND
+
+    def __init__(self, model: str, dimension=None, batch_size: int = 96):
+        self.model = model
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self._cache = None
+        self._lock = threading.Lock()
+        # One rate limit for every concurrent embed() call on this provider
+        self._bucket = TokenBucket(self.requests_per_second)
+        self._local_lock = threading.Lock()
+        self.requests = self.texts = 0
+        self.seconds = 0.0
+
+    def embed_batch(self, texts: list, input_type: str) -> list:
+        """Return the embeddings of one batch of at most ``batch_size`` texts."""
+        raise NotImplementedError
+
+    def batch_indices(self, texts: list, input_type: str) -> list:
+        """Split ``texts`` into batches of positions; consecutive ``batch_size`` windows by default."""
+        return [np.arange(i, min(i + self.batch_size, len(texts)))
+                for i in range(0, len(texts), self.batch_size)]
+
+    def embed(self, texts: list, input_type: str = "search_document", logger_fn=None) -> np.ndarray:
+        """Embed ``texts`` without the cache; returns a float32 matrix."""
+        log = logger_fn or (lambda msg: None)
+        if not texts:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+
+        def call(batch):
+            with self._lock:
+                self.requests += 1
+            return self.embed_batch(batch, input_type)
+
+        indices = self.batch_indices(texts, input_type)
+        batches = [[texts[i] for i in idx] for idx in indices]
+        log(f"Requesting {len(batches)} batches from {self.label}...")
+        start = time.perf_counter()
+        try:
+            if self.remote:
+                results = embed_batches(batches, call, log, concurrency=self.concurrency,
+                                        bucket=self._bucket)
+            else:
+                with self._local_lock:  # One local model run at a time
+                    results = [call(batch) for batch in batches]
+        except Exception as e:
+            raise RuntimeError(f"{self.label} embed call failed: {e}")
+        finally:
+            with self._lock:
+                self.seconds += time.perf_counter() - start
+        with self._lock:
+            self.texts += len(texts)
+        log(f"Received embeddings from {self.label}.")
+        out = None
+        for idx, batch in zip(indices, results):
+            batch = np.asarray(batch, dtype=np.float32)
+            if out is None:
+                out = np.empty((len(texts), batch.shape[1]), dtype=np.float32)
+            out[idx] = batch
+        return out
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        with self._lock:
+            if self._cache is None:
+                self._cache = EmbeddingCache(self.model, self.dimension)
+            return self._cache
+
+    def cache_type(self, input_type: str) -> str:
+        """Return the cache namespace for ``input_type``."""
+        return input_type if self.input_types else "search_document"
+
+    def get(self, texts: list, input_type: str = "search_document", logger_fn=None) -> np.ndarray:
+        """Return embeddings for ``texts``, embedding each distinct cache miss once."""
+        return self.cache.get(
+            texts, self.cache_type(input_type),
+            lambda missing: self.embed(missing, input_type, logger_fn), logger_fn,
+        )
+
+    def unit_matrix(self, texts: list, input_type: str = "search_document", logger_fn=None) -> np.ndarray:
+        """Return the memory-mapped unit-norm matrix of ``texts`` (see embedding_store)."""
+        return load_unit_embeddings(
+            self.cache, texts, self.cache_type(input_type),
+            lambda missing: self.embed(missing, input_type, logger_fn),
+            logger_fn or (lambda msg: None),
+        )
+
+    def metrics(self) -> dict:
+        return {"provider": self.label, "model": self.model, "requests": self.requests,
+                "texts": self.texts, "seconds": self.seconds}
+
+    def metrics_line(self) -> str:
+        rate = self.texts / self.seconds if self.seconds else 0.0
+        return (f"{self.label} ({self.model}): {self.texts} texts in {self.requests} requests, "
+                f"{self.seconds:.1f}s ({rate:.0f} texts/s)")
+
+
+class CohereProvider(EmbeddingProvider):
+    label = "Cohere"
+
+    def __init__(self, client, model: str, dimension=None, batch_size: int = 96):
+        super().__init__(model, dimension, batch_size)
+        self.client = client
+
+    def embed_batch(self, texts, input_type):
+        kwargs = {"output_dimension": self.dimension} if self.dimension else {}
+        resp = self.client.embed(texts=texts, model=self.model, input_type=input_type,
+                                 embedding_types=["float"], **kwargs)
+        return resp.embeddings.float
+
+
+class OpenAIProvider(EmbeddingProvider):
+    label = "OpenAI"
+    input_types = False
+
+    def __init__(self, model: str, dimension=None, batch_size: int = 100, client=None):
+        super().__init__(model, dimension, batch_size)
+        if client is None:
+            import openai as client  # Module-level client, configured via openai.api_key
+        self.client = client
+
+    def embed_batch(self, texts, input_type):
+        kwargs = {"dimensions": self.dimension} if self.dimension else {}
+        response = self.client.embeddings.create(model=self.model, input=texts, **kwargs)
+        if not hasattr(response, "data"):
+            raise RuntimeError("OpenAI response missing data.")
+        return [item.embedding for item in response.data]
+
+
+class SentenceTransformerProvider(EmbeddingProvider):
+    """A local SentenceTransformer model; instruction-aware models get prefixes."""
+
+    label = "local model"
+    remote = False
+    PREFIXES = {"search_document": "passage: ", "search_query": "query: "}
+
+    def __init__(self, model_obj, model: str, dimension=None, batch_size: int = 96,
+                 memory_mb: int = LOCAL_EMBEDDING_MEMORY_MB):
+        super().__init__(model, dimension, batch_size)
+        self.model_obj = model_obj
+        self.memory_mb = memory_mb  # None: fixed batch_size windows in input order
+
+    def batch_indices(self, texts, input_type):
+        if not self.memory_mb:
+            return super().batch_indices(texts, input_type)
+        # Group similar token lengths so each batch pads to little more than its
+        # own rows, sized so its activations fit the memory budget
+        prefix = self.PREFIXES.get(input_type, "")
+        lengths = token_lengths(self.model_obj, [prefix + t for t in texts])
+        return length_buckets(lengths, self.memory_mb * 2**20, activation_bytes(self.model_obj),
+                              self.batch_size)
+
+    def embed_batch(self, texts, input_type):
+        prefix = self.PREFIXES.get(input_type, "")
+        return self.model_obj.encode([prefix + t for t in texts], batch_size=len(texts),
+                                     convert_to_numpy=True, normalize_embeddings=False)
+
+
+class FakeProvider(EmbeddingProvider):
+    """Deterministic vectors from a hash of each text, locally or from a fake server."""
+
+    label = "fake"
+    requests_per_second = 1000.0
+
+    def __init__(self, dimension: int = 64, batch_size: int = 96, url: str = None,
+                 latency: float = 0.0):
+        super().__init__(f"fake-{dimension}", dimension, batch_size)
+        self.url = url
+        self.latency = latency
+
+    def embed_batch(self, texts, input_type):
+        if self.url:
+            return embed_texts(self.url, [f"{input_type}\0{t}" for t in texts], self.dimension)
+        time.sleep(self.latency)
+        return [fake_embedding(f"{input_type}\0{t}", self.dimension) for t in texts]
+
+
+def provider_from_env(name: str) -> EmbeddingProvider:
+    """Build a provider by name using API keys from the environment."""
+    if name == "fake":
+        return FakeProvider(latency=float(os.getenv("FAKE_EMBEDDING_LATENCY", "0.2")))
+    if name == "cohere":
+        import cohere
+
+        return CohereProvider(cohere.ClientV2(api_key=os.environ["COHERE_API_KEY"]), "embed-v4.0", 1536)
+    if name == "openai":
+        import openai
+
+        openai.api_key = os.environ["OPENAI_API_KEY"]
+        return OpenAIProvider("text-embedding-3-large")
+    if name == "qwen":
+        from local_models import local_provider
+
+        return local_provider("Qwen/Qwen3-Embedding-8B")
+    raise ValueError(f"Unknown embedding provider: {name}")
+
+
+def benchmark(names=("fake",), count: int = 2000) -> None:
+    """Embed the same synthetic descriptions with each provider, uncached then cached."""
+    rng = np.random.default_rng(0)
+    words = ["concrete", "brick", "wall", "excavate", "trench", "pipe", "steel", "formwork",
+             "plaster", "paint", "floor", "tile", "door", "window", "roof", "membrane"]
+    texts = [" ".join(rng.choice(words, rng.integers(3, 12))) + f" {i}" for i in range(count)]
+    for name in names:
+        provider = provider_from_env(name)
+        provider.embed(texts, "search_document")
+        print(provider.metrics_line())
+        start = time.perf_counter()
+        provider.get(texts, "search_document")
+        provider.get(texts, "search_document")
+        print(f"  cached twice: {time.perf_counter() - start:.2f}s, {provider.requests} requests total")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["--benchmark"]:
+        benchmark(sys.argv[2:] or ("fake",))
@@ -0,0 +1,137 @@
+"""embedding_scheduler.py
+Concurrent, rate-limit aware scheduling of embedding API batches.
+
+Keeps up to ``EMBEDDING_CONCURRENCY`` batch requests in flight on a thread
+pool. Requests are paced by a token bucket. On HTTP 429 (or 503) the bucket
+waits out ``Retry-After``, halves its rate and creeps back up as calls succeed.
+Results are returned in batch order whatever order the requests finish in.
+"""
+
+import email.utils
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+EMBEDDING_CONCURRENCY = 4            # Batch requests kept in flight
+EMBEDDING_REQUESTS_PER_SECOND = 10.0  # Starting request rate of the token bucket
+EMBEDDING_MAX_RETRIES = 6            # Rate-limited retries per batch
+RETRY_STATUS_CODES = (429, 503)
+
+
+def _status_code(exc):
+    for obj in (exc, getattr(exc, "response", None)):
+        for attr in ("status_code", "http_status", "code", "status"):
+            value = getattr(obj, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def retry_after(exc):
+    """Return seconds to wait before retrying ``exc``, or None if it is not retryable.
+
+    Understands the exceptions raised by the Cohere and OpenAI clients and by
+    ``urllib`` (status code plus optional ``Retry-After`` header, in seconds or
+    as an HTTP date). Returns 0 when the server gave no hint.
+    """
+    if _status_code(exc) not in RETRY_STATUS_CODES:
+        return None
+    headers = getattr(exc, "headers", None) or getattr(getattr(exc, "response", None), "headers", None)
+    value = None
+    if headers is not None:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """Thread-safe token bucket whose rate adapts to rate-limit responses."""
+
+    def __init__(self, rate: float, capacity: float = None, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def throttle(self, delay: float) -> None:
+        """Pause all requests for ``delay`` seconds and halve the rate."""
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+
+    def succeeded(self) -> None:
+        """Recover the rate additively after a successful request."""
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def embed_batches(batches: list, embed_fn, logger_fn=None,
+                  concurrency: int = EMBEDDING_CONCURRENCY,
+                  requests_per_second: float = EMBEDDING_REQUESTS_PER_SECOND,
+                  max_retries: int = EMBEDDING_MAX_RETRIES, bucket: TokenBucket = None) -> list:
+    """Call ``embed_fn`` on every batch concurrently and return results in batch order.
+
+    ``embed_fn(batch)`` returns the embeddings of one batch. Rate-limited calls
+    are retried with the server's ``Retry-After`` (or exponential backoff);
+    any other exception, or running out of retries, is raised to the caller.
+    Pass a shared ``bucket`` to pace concurrent calls against one API limit.
+    """
+    bucket = bucket or TokenBucket(requests_per_second)
+    total = len(batches)
+
+    def run(number, batch):
+        for attempt in range(max_retries + 1):
+            bucket.acquire()
+            try:
+                result = embed_fn(batch)
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None or attempt == max_retries:
+                    raise
+                delay = delay or min(60.0, 2.0 ** attempt)
+                bucket.throttle(delay)
+                if logger_fn:
+                    logger_fn(f"Batch {number}/{total} rate limited; retrying in {delay:.1f}s...")
+                continue
+            bucket.succeeded()
+            if logger_fn:
+                logger_fn(f"Received batch {number}/{total}.")
+            return result
+
+    if total <= 1 or concurrency <= 1:
+        return [run(i + 1, batch) for i, batch in enumerate(batches)]
+    with ThreadPoolExecutor(max_workers=min(concurrency, total)) as pool:
+        futures = [pool.submit(run, i + 1, batch) for i, batch in enumerate(batches)]
+        try:
+            return [f.result() for f in futures]
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
@@ -0,0 +1,84 @@
+"""embedding_store.py
+Memory-mapped, pre-normalized embedding matrix for a price list.
+
+The store is a float32 ``.npy`` file of unit-length rows written once per
+distinct price list (named by the hash of its cache keys) next to the
+:class:`embedding_cache.EmbeddingCache` it is built from. It is opened with
+``np.load(mmap_mode="r")`` so every process shares the page cache and
+similarity search reads it without copying.
+
+Every price-list edit produces a new store, so only the
+``EMBEDDING_STORE_KEEP`` most recently used stores of a cache are kept.
+Writing a new store deletes older ones together with their sidecar files
+(``unit-<hash>.*``: the ANN index and compact codes); opening a store marks
+it as used. A store still mapped by another process is skipped where the OS
+refuses the delete and removed on a later prune.
+"""
+
+import glob
+import hashlib
+import os
+
+import numpy as np
+
+from embedding_cache import text_key
+
+EMBEDDING_STORE_KEEP = int(os.getenv("EMBEDDING_STORE_KEEP", "3"))  # Stores kept per cache
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale float32 ``vectors`` to unit length in place and return them."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    vectors /= norms
+    return vectors
+
+
+def store_path(cache, texts: list, input_type: str) -> str:
+    """Return the store file for ``texts`` in row order."""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text_key(text, input_type).encode("ascii"))
+    return os.path.join(cache.path, f"unit-{digest.hexdigest()[:24]}.npy")
+
+
+def prune_stores(cache_path: str, keep: int = EMBEDDING_STORE_KEEP) -> list:
+    """Delete all but the ``keep`` most recently used stores and their sidecars.
+
+    Returns the deleted store paths.
+    """
+    stores = [p for p in glob.glob(os.path.join(cache_path, "unit-*.npy")) if ".tmp." not in p]
+    stores.sort(key=lambda p: os.stat(p).st_mtime, reverse=True)
+    deleted = []
+    for path in stores[max(keep, 1):]:
+        try:
+            for sidecar in glob.glob(path[: -len(".npy")] + ".*.npz"):
+                os.remove(sidecar)
+            os.remove(path)
+        except OSError:
+            continue  # Still open elsewhere (Windows); retried next time
+        deleted.append(path)
+    return deleted
+
+
+def load_unit_embeddings(cache, texts: list, input_type: str, embed_fn, logger_fn) -> np.ndarray:
+    """Return the read-only unit embedding matrix for ``texts``.
+
+    Builds the store from ``cache`` (embedding misses with ``embed_fn``) the
+    first time a given price list is seen, then maps the file directly.
+    """
+    path = store_path(cache, texts, input_type)
+    if not os.path.exists(path):
+        vectors = normalize_rows(cache.get(texts, input_type, embed_fn, logger_fn))
+        os.makedirs(cache.path, exist_ok=True)
+        tmp_path = path[:-4] + f".{os.getpid()}.tmp.npy"
+        np.save(tmp_path, vectors)
+        os.replace(tmp_path, path)
+        logger_fn(f"Wrote embedding store {os.path.basename(path)}.")
+        deleted = prune_stores(cache.path)
+        if deleted:
+            logger_fn(f"Removed {len(deleted)} older embedding stores.")
+    else:
+        os.utime(path)  # Mark as recently used for prune_stores
+        logger_fn(f"Opened embedding store {os.path.basename(path)}.")
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,111 @@
+"""fake_embedding_server.py
+Local stand-in for an embedding API, for exercising the batch scheduler.
+
+POST ``/embed`` with ``{"texts": [...], "dimension": 64}`` returns
+``{"embeddings": [[...], ...]}``. The vectors are derived from a hash of each
+text, so they are the same on every run. The server can add latency and answer
+429 with ``Retry-After`` once a per-second request budget is used up::
+
+    python fake_embedding_server.py --port 8765 --latency 0.2 --rate-limit 5
+
+:func:`embed_texts` is a matching client that raises ``urllib`` errors, which
+``embedding_scheduler.retry_after`` understands.
+"""
+
+import hashlib
+import json
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def fake_embedding(text: str, dimension: int) -> list:
+    """Return the deterministic embedding of ``text``."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32).tolist()
+
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    rate_limit = None
+    _lock = threading.Lock()
+    _window = [0.0, 0]  # window start, requests in window
+
+    def _over_limit(self) -> bool:
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window[0] >= 1.0:
+                self._window[:] = [now, 0]
+            self._window[1] += 1
+            return self._window[1] > self.rate_limit
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self._over_limit():
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.end_headers()
+            return
+        time.sleep(self.latency)
+        dimension = int(body.get("dimension", 64))
+        payload = json.dumps(
+            {"embeddings": [fake_embedding(t, dimension) for t in body["texts"]]}
+        ).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 8765, latency: float = 0.0, rate_limit: int = None) -> ThreadingHTTPServer:
+    """Start the server on a background thread and return it."""
+    handler = type(
+        "Handler", (FakeEmbeddingHandler,),
+        # Each server counts its own rate-limit window
+        {"latency": latency, "rate_limit": rate_limit, "_window": [0.0, 0]},
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def embed_texts(url: str, texts: list, dimension: int = 64) -> list:
+    """Embed ``texts`` with a running fake server at ``url``."""
+    request = urllib.request.Request(
+        url.rstrip("/") + "/embed",
+        data=json.dumps({"texts": texts, "dimension": dimension}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as resp:
+        return json.loads(resp.read())["embeddings"]
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake embedding API.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per request")
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per second")
+    args = parser.parse_args()
+    server = serve(args.port, args.latency, args.rate_limit)
+    print(f"Fake embedding server on http://127.0.0.1:{args.port}/embed")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""inquiry_io.py
+Two-pass reading and writing of inquiry (tender) workbooks.
+
+:func:`scan_inquiry` streams every sheet once in read-only mode, finds the
+Description/Rate/Qty header row and collects the lines with an empty rate,
+without materialising cell objects. Matchers then build a
+``{sheet title: {(row, col): value}}`` map of the cells to fill, and
+:func:`write_inquiry` writes only those cells into a copy of the workbook,
+patching the affected sheet XML in place (see ``xlsx_patch``) and falling
+back to an openpyxl round trip for workbooks the patcher cannot edit.
+"""
+
+import os
+from itertools import chain
+
+from openpyxl import load_workbook
+
+from xlsx_patch import UnpatchableWorkbook, patch_workbook
+
+HEADER_SCAN_ROWS = 10  # Rows searched for the header labels
+
+
+def _find_headers(rows: list) -> tuple:
+    """Return ``(header_row, desc_col, rate_col, qty_col)`` from the first rows.
+
+    Columns are 1-based. Labels may be spread over several rows; the header
+    row is the first one by which both Description and Rate have been seen.
+    """
+    desc_col = rate_col = qty_col = None
+    for row_idx, values in enumerate(rows, start=1):
+        for col_idx, val in enumerate(values, start=1):
+            if isinstance(val, str):
+                low = val.strip().lower()
+                if low == "description":
+                    desc_col = col_idx
+                elif low == "rate":
+                    rate_col = col_idx
+                elif low in ("qty", "quantity"):
+                    qty_col = col_idx
+        if desc_col and rate_col:
+            return row_idx, desc_col, rate_col, qty_col
+    return None, desc_col, rate_col, qty_col
+
+
+def _value(values: tuple, col: int):
+    return values[col - 1] if col and col <= len(values) else None
+
+
+def scan_inquiry(inquiry_path: str, preprocess_fn, logger_fn, skip_fn=None) -> tuple:
+    """Return ``(items_to_fill, header_rows)`` for an inquiry workbook.
+
+    ``items_to_fill`` lists ``((sheet_title, row, rate_col), text)`` for every
+    line with a description, a quantity (when the sheet has a Qty column) and
+    an empty rate. ``text`` is ``preprocess_fn`` applied to the description,
+    and lines for which ``skip_fn(description)`` is true are left out.
+    ``header_rows`` maps each priced sheet's title to
+    ``(header_row, desc_col, rate_col, qty_col, max_col)``.
+    """
+    logger_fn("Reading inquiry file...")
+    try:
+        wb_inq = load_workbook(inquiry_path, read_only=True, data_only=False)
+    except Exception as e:
+        raise RuntimeError(f"Failed to open inquiry file: {e}")
+
+    items_to_fill = []
+    header_rows = {}
+    try:
+        for sheet in wb_inq.worksheets:
+            logger_fn(f"Scanning inquiry sheet '{sheet.title}' for headers...")
+            # Stored dimensions can be stale; read every row that is present
+            sheet.reset_dimensions()
+            rows = sheet.iter_rows(values_only=True)
+            head = []
+            for values in rows:
+                head.append(values)
+                if len(head) == HEADER_SCAN_ROWS:
+                    break
+            hdr_row, desc_col, rate_col, qty_col = _find_headers(head)
+            if hdr_row is None:
+                logger_fn(f"Skipping sheet '{sheet.title}' (no valid headers).")
+                continue
+            logger_fn((f"Found headers in '{sheet.title}' at row {hdr_row} "
+                       f"(Desc col={desc_col}, Rate col={rate_col}, Qty col={qty_col})."))
+
+            max_col = max((len(v) for v in head), default=0)
+            count = 0
+            row_idx = hdr_row
+            for values in chain(head[hdr_row:], rows):
+                row_idx += 1
+                max_col = max(max_col, len(values))
+                desc = _value(values, desc_col)
+                if not desc or str(desc).strip() == "":
+                    continue
+                if skip_fn is not None and skip_fn(desc):
+                    continue
+                if qty_col:
+                    qty = _value(values, qty_col)
+                    if qty is None or str(qty).strip() == "":
+                        continue
+                if _value(values, rate_col) not in (None, ""):
+                    continue
+                items_to_fill.append(((sheet.title, row_idx, rate_col), preprocess_fn(str(desc))))
+                count += 1
+            header_rows[sheet.title] = (hdr_row, desc_col, rate_col, qty_col, max_col)
+            logger_fn(f"Found {count} items to price in '{sheet.title}'.")
+    finally:
+        wb_inq.close()
+    if not items_to_fill:
+        raise RuntimeError("No inquiry items with empty rates found in the inquiry file.")
+    return items_to_fill, header_rows
+
+
+def result_columns(header_rows: dict, labels: list) -> tuple:
+    """Place result columns after each priced sheet's last column.
+
+    Returns ``(cells, first_cols)``: the header-label cells to write, keyed
+    like :func:`write_inquiry` expects, and the column of ``labels[0]`` per
+    sheet title.
+    """
+    cells = {}
+    first_cols = {}
+    for title, (hdr, _, _, _, max_col) in header_rows.items():
+        first_cols[title] = max_col + 1
+        cells[title] = {(hdr, max_col + 1 + i): label for i, label in enumerate(labels)}
+    return cells, first_cols
+
+
+def write_inquiry(inquiry_path: str, output_path: str, cells: dict, logger_fn,
+                  general_cells=()) -> None:
+    """Copy the inquiry to ``output_path`` with ``cells`` filled in.
+
+    ``cells`` maps sheet titles to ``{(row, col): value}``. Cells listed in
+    ``general_cells`` as ``(sheet_title, row, col)`` also get the General
+    number format.
+    """
+    logger_fn(f"Saving output file as: {output_path}")
+    try:
+        patch_workbook(inquiry_path, output_path, cells, general_cells)
+        return
+    except UnpatchableWorkbook as e:
+        logger_fn(f"Cannot patch inquiry in place ({e}); saving with openpyxl...")
+    wb_inq = load_workbook(inquiry_path, read_only=False, data_only=False)
+    try:
+        for title, values in cells.items():
+            sheet = wb_inq[title]
+            for (row, col), value in values.items():
+                sheet.cell(row=row, column=col).value = value
+        for title, row, col in general_cells:
+            wb_inq[title].cell(row=row, column=col).number_format = "General"
+        # As patch_workbook: never leave a half-written output behind
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        try:
+            wb_inq.save(tmp_path)
+            os.replace(tmp_path, output_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    finally:
+        wb_inq.close()
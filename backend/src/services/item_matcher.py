@@ -1,13 +1,27 @@
 # Item matcher script for mapping descriptions to price list entries
 # Uses basic fuzzy matching and token similarity (Jaccard)
+#
+# The price list is indexed by token once at load time so each input item
+# only scores the price items that share a token with it, plus any item whose
+# length still allows it to beat the best candidate on fuzzy ratio alone.
+# Jaccard scores for a block of input items come from one sparse product.
+# Pass --exact to score every price item and compare the results.
 
 import csv
 import re
 import sys
+from bisect import bisect_left, bisect_right
 from difflib import SequenceMatcher
 from pathlib import Path
 
+from parallel_ingest import ingest_csv
+from text_memo import TextMemo
+from token_vocab import TokenVocabulary, jaccard_scores
 
+JACCARD_BLOCK_SIZE = 1024  # Input rows scored per sparse Jaccard product
+
+
+@TextMemo
 def preprocess(text: str) -> str:
     text = text.lower()
     text = re.sub(r"[^a-z0-9\s]", " ", text)
@@ -27,38 +41,59 @@ def jaccard(a: str, b: str) -> float:
     return len(set_a & set_b) / len(set_a | set_b)
 
 
+def build_token_index(price_items: list) -> dict:
+    """Return the token index used by :func:`match_item`.
+
+    Holds the price list encoded over a shared :class:`TokenVocabulary` (its
+    columns act as token postings) and the positions sorted by description
+    length, used to find items that share no token but could still win on
+    fuzzy ratio.
+    """
+    texts = [item["desc_clean"] for item in price_items]
+    vocab = TokenVocabulary(texts)
+    by_length = sorted((len(text), pos) for pos, text in enumerate(texts))
+    return {
+        "vocab": vocab,
+        "tokens": vocab.encode(texts),
+        "lengths": [length for length, _ in by_length],
+        "by_length": [pos for _, pos in by_length],
+    }
+
+
+def _price_item(row: dict, _context=None) -> dict:
+    desc = (
+        row.get("description")
+        or row.get("Description")
+        or row.get("desc")
+        or row.get("Desc")
+        or ""
+    )
+    code = row.get("code") or row.get("Code") or ""
+    rate = (
+        row.get("rate")
+        or row.get("Rate")
+        or row.get("unit_price")
+        or row.get("Unit Price")
+        or row.get("Unit Rate")
+        or row.get("unit_rate")
+        or row.get("price")
+        or row.get("Price")
+    )
+    return {
+        "code": code.strip(),
+        "description": desc.strip(),
+        "desc_clean": preprocess(desc),
+        "rate": float(rate) if rate not in (None, "") else None,
+    }
+
+
 def load_price_list(path: str):
-    items = []
-    with open(path, newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            desc = (
-                row.get("description")
-                or row.get("Description")
-                or row.get("desc")
-                or row.get("Desc")
-                or ""
-            )
-            code = row.get("code") or row.get("Code") or ""
-            rate = (
-                row.get("rate")
-                or row.get("Rate")
-                or row.get("unit_price")
-                or row.get("Unit Price")
-                or row.get("Unit Rate")
-                or row.get("unit_rate")
-                or row.get("price")
-                or row.get("Price")
-            )
-            items.append(
-                {
-                    "code": code.strip(),
-                    "description": desc.strip(),
-                    "desc_clean": preprocess(desc),
-                    "rate": float(rate) if rate not in (None, "") else None,
-                }
-            )
-    return items
+    """Return the parsed price items and their token index.
+
+    Rows are parsed and preprocessed on a process pool (see parallel_ingest).
+    """
+    items = ingest_csv(path, _price_item)
+    return items, build_token_index(items)
 
 
 def load_input_items(path: str):
@@ -79,7 +114,7 @@ def load_input_items(path: str):
     return items
 
 
-def match_item(desc_clean: str, price_items: list) -> tuple:
+def match_item_exact(desc_clean: str, price_items: list) -> tuple:
     best = None
     best_score = 0.0
     for item in price_items:
@@ -92,12 +127,99 @@ def match_item(desc_clean: str, price_items: list) -> tuple:
     return best, best_score
 
 
-def match_all(price_file: str, input_file: str) -> list:
-    price_items = load_price_list(price_file)
+def _length_window(length: int, threshold: float, lengths: list) -> tuple:
+    """Return the slice of ``lengths`` whose ratio upper bound reaches ``threshold``.
+
+    ``SequenceMatcher.ratio`` is at most 2*min(a, b)/(a + b), so an item can
+    only reach ``threshold`` when its length lies in a window around ``length``.
+    """
+    if threshold <= 0:
+        return 0, len(lengths)
+    if threshold > 1:
+        return 0, 0
+    # Widen slightly so float rounding never drops an item on the boundary
+    threshold = max(threshold - 1e-9, 0.0)
+    low = threshold * length / (2 - threshold)
+    high = length * (2 - threshold) / threshold if threshold else float("inf")
+    return bisect_left(lengths, low), bisect_right(lengths, high)
+
+
+def match_item(
+    desc_clean: str, price_items: list, index: dict = None, jaccard_row=None
+) -> tuple:
+    """Return the best price item and its score for ``desc_clean``.
+
+    Gives the same result as :func:`match_item_exact` (including the first-wins
+    tie break) but only scores items that share a token with the input, then
+    items without a shared token whose length bound can still match the best.
+    ``jaccard_row`` is the input's row of :func:`token_vocab.jaccard_scores`
+    when the caller has scored a whole batch at once.
+    """
+    if index is None:
+        return match_item_exact(desc_clean, price_items)
+    if jaccard_row is None:
+        query = index["vocab"].encode([desc_clean])
+        jaccard_row = jaccard_scores(query, index["tokens"])
+
+    candidates = jaccard_row.indices.tolist()
+    j_scores = jaccard_row.data.tolist()
+
+    best_pos = None
+    best_score = 0.0
+    matcher = SequenceMatcher(None, desc_clean)
+    for pos, j in zip(candidates, j_scores):
+        matcher.set_seq2(price_items[pos]["desc_clean"])
+        # Later positions only win on a strictly higher score
+        if 0.6 * matcher.quick_ratio() + 0.4 * j <= best_score:
+            continue
+        score = 0.6 * matcher.ratio() + 0.4 * j
+        if score > best_score:
+            best_score = score
+            best_pos = pos
+
+    # Items sharing no token have a Jaccard of 0, so only fuzzy ratio counts
+    start, stop = _length_window(len(desc_clean), best_score / 0.6, index["lengths"])
+    seen = set(candidates)
+    for pos in index["by_length"][start:stop]:
+        if pos in seen:
+            continue
+        matcher.set_seq2(price_items[pos]["desc_clean"])
+        if 0.6 * matcher.quick_ratio() < best_score:
+            continue
+        score = 0.6 * matcher.ratio()
+        if score > best_score or (
+            score == best_score and best_pos is not None and pos < best_pos
+        ):
+            best_score = score
+            best_pos = pos
+
+    if best_pos is None:
+        return None, 0.0
+    return price_items[best_pos], best_score
+
+
+def match_all(price_file: str, input_file: str, exact: bool = False) -> list:
+    price_items, index = load_price_list(price_file)
     input_items = load_input_items(input_file)
+    return match_loaded(price_items, index, input_items, exact)
+
+
+def match_loaded(price_items: list, index: dict, input_items: list, exact: bool = False) -> list:
+    """Match already loaded input items against a loaded, indexed price list."""
     results = []
-    for item in input_items:
-        best, score = match_item(item["desc_clean"], price_items)
+    for i, item in enumerate(input_items):
+        if exact:
+            best, score = match_item_exact(item["desc_clean"], price_items)
+        else:
+            if i % JACCARD_BLOCK_SIZE == 0:
+                block = [it["desc_clean"] for it in input_items[i : i + JACCARD_BLOCK_SIZE]]
+                j_block = jaccard_scores(index["vocab"].encode(block), index["tokens"])
+            best, score = match_item(
+                item["desc_clean"],
+                price_items,
+                index,
+                j_block[i % JACCARD_BLOCK_SIZE],
+            )
         matched_code = best["code"] if best else ""
         matched_desc = best["description"] if best else ""
         rate = best["rate"] if best else None
@@ -117,17 +239,20 @@ def match_all(price_file: str, input_file: str) -> list:
 
 
 def main() -> None:
-    if len(sys.argv) < 3:
+    args = [a for a in sys.argv[1:] if a != "--exact"]
+    exact = len(args) != len(sys.argv) - 1
+    if len(args) < 2:
         print(
-            "Usage: python item_matcher.py <price_list.csv> <input_items.csv> [output.csv]"
+            "Usage: python item_matcher.py [--exact] <price_list.csv> <input_items.csv> [output.csv]"
         )
         sys.exit(1)
 
-    price_file = sys.argv[1]
-    input_file = sys.argv[2]
-    output_file = sys.argv[3] if len(sys.argv) > 3 else None
+    price_file = args[0]
+    input_file = args[1]
+    output_file = args[2] if len(args) > 2 else None
 
-    results = match_all(price_file, input_file)
+    results = match_all(price_file, input_file, exact=exact)
+    print(preprocess.stats_line(), file=sys.stderr)
 
     fieldnames = [
         "input_description",
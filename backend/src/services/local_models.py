@@ -0,0 +1,179 @@
+"""local_models.py
+Process-wide manager for local SentenceTransformer embedding models.
+
+:func:`load_model` loads each (model, quantization, truncation, device)
+combination once per process and hands the same instance to every caller, so
+pricing runs after the first skip the multi-GB load. Options:
+
+- ``quantize="int8"``: dynamic int8 quantization of the Linear layers
+  (``torch.quantization.quantize_dynamic``), CPU only. Roughly halves CPU
+  encode time for transformer encoders at a small accuracy cost.
+- ``truncate_dim``: keep the first N output dimensions of a Matryoshka model
+  (Qwen3-Embedding supports this). It shrinks vectors and search cost, not
+  encode time; for faster encoding pick a smaller model of the family.
+
+:func:`local_provider` wraps a managed model in a
+``SentenceTransformerProvider`` whose cache namespace includes the options,
+so vectors from different settings never mix. The provider batches by token
+length (:func:`length_buckets`): texts are sorted longest first and each batch
+holds as many rows of its padded length as fit ``LOCAL_EMBEDDING_MEMORY_MB``
+of activations (:func:`activation_bytes`), up to the configured batch size.
+Short rows therefore run in large batches instead of padding to a clause.
+
+``python local_models.py --benchmark [--model NAME] [--count N]`` prints
+texts/sec for each setting on the current device.
+"""
+
+import os
+import threading
+import time
+
+import numpy as np
+
+LOCAL_MODEL_DEVICE = os.getenv("LOCAL_MODEL_DEVICE") or None  # e.g. "cpu" or "cuda"; None picks
+# Activation memory one encode batch may use; batch sizes follow from it
+LOCAL_EMBEDDING_MEMORY_MB = int(os.getenv("LOCAL_EMBEDDING_MEMORY_MB", "1024"))
+QUANTIZATIONS = (None, "int8")
+
+_models: dict = {}
+_lock = threading.Lock()
+
+
+def model_key(name: str, quantize: str = None, truncate_dim: int = None) -> str:
+    """Return the embedding cache model name for a model setting."""
+    key = name
+    if quantize:
+        key += f":{quantize}"
+    if truncate_dim:
+        key += f":mrl{truncate_dim}"
+    return key
+
+
+def load_model(name: str, quantize: str = None, truncate_dim: int = None,
+               device: str = LOCAL_MODEL_DEVICE, logger_fn=None):
+    """Return the process-wide SentenceTransformer for this setting, loading it once."""
+    if quantize not in QUANTIZATIONS:
+        raise RuntimeError(f"Unknown quantization: {quantize}")
+    key = (name, quantize, truncate_dim, device)
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+        from sentence_transformers import SentenceTransformer
+
+        if logger_fn:
+            logger_fn(f"Loading embedding model: {model_key(name, quantize, truncate_dim)}. "
+                      "This may take a moment...")
+        start = time.perf_counter()
+        try:
+            model = SentenceTransformer(name, device=device, truncate_dim=truncate_dim)
+            if quantize == "int8":
+                import torch
+
+                if model.device.type != "cpu":
+                    raise RuntimeError("int8 dynamic quantization runs on CPU only.")
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        except RuntimeError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to load embedding model {name}: {e}")
+        _models[key] = model
+    if logger_fn:
+        logger_fn(f"Embedding model loaded in {time.perf_counter() - start:.1f}s.")
+    return model
+
+
+def token_lengths(model, texts: list) -> np.ndarray:
+    """Return each text's token count as the model will see it (after truncation)."""
+    max_len = getattr(model, "max_seq_length", None) or 512
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        # Roughly four characters per token for English BoQ text
+        return np.minimum(np.fromiter((len(t) // 4 + 2 for t in texts), np.int64, len(texts)), max_len)
+    ids = tokenizer(list(texts), add_special_tokens=True, truncation=True, max_length=max_len)["input_ids"]
+    return np.fromiter(map(len, ids), np.int64, len(ids))
+
+
+def activation_bytes(model) -> tuple:
+    """Estimate peak activation bytes of one layer as ``(per token, per token pair)``.
+
+    Per token: fp32 hidden states, Q/K/V/output projections and the FFN
+    intermediate. Per token pair: one attention score per head.
+    """
+    config = None
+    try:
+        config = model[0].auto_model.config
+    except (AttributeError, IndexError, KeyError, TypeError):
+        pass
+    hidden = getattr(config, "hidden_size", None) or 1024
+    heads = getattr(config, "num_attention_heads", None) or 16
+    intermediate = getattr(config, "intermediate_size", None) or 4 * hidden
+    return 4 * (5 * hidden + intermediate), 4 * heads
+
+
+def length_buckets(lengths, budget_bytes: int, cost: tuple, max_batch: int) -> list:
+    """Group positions by token length, longest first, into batches within ``budget_bytes``.
+
+    Each batch pads to its first (longest) row, so its size is the most rows of
+    that length whose activations fit the budget, capped at ``max_batch``.
+    """
+    lengths = np.asarray(lengths)
+    per_token, per_pair = cost
+    order = np.argsort(-lengths, kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = int(lengths[order[start]])
+        per_row = longest * per_token + longest * longest * per_pair
+        size = max(1, min(max_batch, budget_bytes // max(per_row, 1)))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+def local_provider(name: str, quantize: str = None, truncate_dim: int = None,
+                   dimension=None, batch_size: int = 256, logger_fn=None):
+    """Return a ``SentenceTransformerProvider`` over the managed model."""
+    from embedding_providers import SentenceTransformerProvider
+
+    model = load_model(name, quantize, truncate_dim, logger_fn=logger_fn)
+    return SentenceTransformerProvider(model, model_key(name, quantize, truncate_dim),
+                                       truncate_dim or dimension, batch_size)
+
+
+def benchmark(name: str, count: int = 2000, batch_size: int = 256) -> None:
+    """Print texts/sec per setting on synthetic BoQ descriptions of mixed length."""
+    rng = np.random.default_rng(0)
+    words = ["concrete", "brick", "wall", "excavate", "trench", "pipe", "steel", "formwork",
+             "plaster", "paint", "floor", "tile", "door", "window", "roof", "membrane",
+             "reinforcement", "including", "all", "necessary", "fixings", "complete"]
+    texts = [" ".join(rng.choice(words, rng.integers(3, 60))) for _ in range(count)]
+
+    settings = [
+        ("fp32, batches in input order", None, None, False),
+        ("fp32, token-length buckets", None, None, True),
+        ("int8, token-length buckets", "int8", None, True),
+        ("int8, buckets, 256 dims", "int8", 256, True),
+    ]
+    for label, quantize, truncate_dim, bucket in settings:
+        provider = local_provider(name, quantize, truncate_dim, batch_size=batch_size)
+        if not bucket:
+            provider.memory_mb = None
+        provider.embed(texts[:batch_size])  # Warm-up
+        start = time.perf_counter()
+        vecs = provider.embed(texts)
+        elapsed = time.perf_counter() - start
+        print(f"{label:32s} {count / elapsed:8.1f} texts/s  dim={vecs.shape[1]}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark local embedding model settings.")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--model", default="Qwen/Qwen3-Embedding-0.6B")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=256, help="largest batch")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.model, args.count, args.batch_size)
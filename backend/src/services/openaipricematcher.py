@@ -3,16 +3,30 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 import openai
 import numpy as np
-from openpyxl import load_workbook
-from pymongo import MongoClient
 import os
 import threading
 from datetime import datetime
 import re
 
+from ann_index import load_or_build_index
+from compact_index import load_or_build_compact
+from embedding_providers import OpenAIProvider
+from embedding_store import normalize_rows
+from inquiry_io import result_columns, scan_inquiry, write_inquiry
+from pricelist_sync import sync_pricelist
+from text_memo import TEXT_MEMO_STORE, TextMemo
+from text_normalizer import NORMALIZER_VERSION, normalize_text
+from token_vocab import TokenVocabulary, jaccard_blender, jaccard_pairs, tokenize
+from tk_log import TkLog
+from topk_search import topk_similarity
+
 # --- CONFIGURABLE CONSTANTS ---
 EMBEDDING_MODEL = "text-embedding-3-large"
 EMBEDDING_BATCH_SIZE = 100
+USE_ANN_INDEX = False  # Approximate (IVF) search instead of exact, see ann_index.py
+ANN_CANDIDATES = 50    # Cosine candidates per row re-scored with Jaccard
+EMBEDDING_STORAGE = None  # Compact codes: "float16", "int8", "binary" (memory only) or "matryoshka" (compact_index.py)
+CASCADE_DIMENSIONS = 256  # Prefix scanned in "matryoshka" mode before full-dimension rescoring
 
 class PricelistMatcherApp:
     def __init__(self, root):
@@ -71,6 +85,7 @@ class PricelistMatcherApp:
 
         lbl5.grid(row=3, column=0, sticky="nw", pady=(10, 0))
         self.log_box.grid(row=3, column=1, columnspan=2, pady=(10, 0))
+        self.log = TkLog(self.root, self.log_box)
 
         self.process_btn = tk.Button(
             frm,
@@ -82,13 +97,6 @@ class PricelistMatcherApp:
         )
         self.process_btn.grid(row=4, column=1, pady=12, sticky="w")
 
-    def log(self, msg):
-        self.log_box.config(state="normal")
-        self.log_box.insert(tk.END, msg + "\n")
-        self.log_box.see(tk.END)
-        self.log_box.config(state="disabled")
-        self.root.update_idletasks()
-
     def get_auto_output_path(self):
         folder = self.output_folder.get()
         if not folder:
@@ -125,14 +133,16 @@ class PricelistMatcherApp:
             self.log("Starting processing...")
 
             price_descs, price_rates = load_pricelist_from_db(self.log)
-            wb_inq, items_to_fill, header_rows = load_inquiry_data(self.inquiry_path.get(), self.log)
-            fill_inquiry_rates(
-                wb_inq, items_to_fill, price_descs, price_rates, header_rows,
-                EMBEDDING_MODEL, self.log)
-
-            self.log(f"Saving output file as: {output_path}")
-            wb_inq.save(output_path)
-            wb_inq.close()
+            items_to_fill, header_rows = load_inquiry_data(self.inquiry_path.get(), self.log)
+            preprocess_text.flush()
+            self.log(preprocess_text.stats_line())
+            provider = OpenAIProvider(EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE)
+            cells = fill_inquiry_rates(
+                provider, items_to_fill, price_descs, price_rates, header_rows, self.log)
+            self.log(tokenize.stats_line())
+            self.log(provider.metrics_line())
+
+            write_inquiry(self.inquiry_path.get(), output_path, cells, self.log)
             self.log("Output file saved.")
             messagebox.showinfo("Success", f"Pricing completed. Output saved to:\n{output_path}")
         except Exception as e:
@@ -143,77 +153,15 @@ class PricelistMatcherApp:
 
 # --- CORE PROCESSING FUNCTIONS ---
 
-SYNONYM_MAP = {
-    "bricks": "brick",
-    "brickwork": "brick",
-    "blocks": "brick",
-    "blockwork": "brick",
-    "cement": "concrete",
-    "concrete": "concrete",
-    "footing": "foundation",
-    "footings": "foundation",
-    "excavation": "excavate",
-    "excavations": "excavate",
-    "excavate": "excavate",
-    "dig": "excavate",
-    "installation": "install",
-    "installing": "install",
-    "installed": "install",
-    "demolition": "demolish",
-    "demolish": "demolish",
-    "demolishing": "demolish",
-    "remove": "demolish",
-    "supply": "provide",
-    "supplies": "provide",
-    "providing": "provide",
-}
-
-STOP_WORDS = {
-    "the","and","of","to","in","for","on","at","by","from","with",
-    "a","an","be","is","are","as","it","its","into","or",
-}
-
-def apply_synonyms(text):
-    parts = []
-    for w in text.split():
-        w = SYNONYM_MAP.get(w, w)
-        if len(w) > 3:
-            w = re.sub(r"(ings|ing|ed|es|s)$", "", w)
-        parts.append(w)
-    return " ".join(parts)
-
-def remove_stop_words(text):
-    return " ".join([w for w in text.split() if w and w not in STOP_WORDS])
-
-def preprocess_text(s):
-    if not s:
-        return ""
-    s = str(s).lower()
-    s = re.sub(r"[^a-z0-9\s]", " ", s)
-    s = re.sub(r"\b\d+(?:\.\d+)?\b", " ", s)
-    s = re.sub(r"\s+(mm|cm|m|inch|in|ft)\b", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    s = apply_synonyms(s)
-    s = remove_stop_words(s)
-    return s
+# Descriptions repeat across sheets and tenders; memoized and shared between runs
+preprocess_text = TextMemo(normalize_text, store=TEXT_MEMO_STORE, version=NORMALIZER_VERSION)
 
 def load_pricelist_from_db(logger_fn):
     uri = os.getenv("CONNECTION_STRING")
     if not uri:
         raise RuntimeError("CONNECTION_STRING environment variable not set")
     logger_fn("Loading pricelist from database...")
-    client = MongoClient(uri)
-    db = client.get_default_database()
-    col = db["priceitems"]
-    descriptions = []
-    rates = []
-    for doc in col.find({"rate": {"$ne": None}, "unit": {"$exists": True, "$ne": ""}}, {"fullContext":1, "rate":1}):
-        desc = doc.get("fullContext")
-        rate = doc.get("rate")
-        if desc and rate is not None:
-            descriptions.append(preprocess_text(desc))
-            rates.append(rate)
-    client.close()
+    descriptions, rates = sync_pricelist(uri, "fullContext", preprocess_text, logger_fn)
     if not descriptions:
         raise RuntimeError("No item descriptions with rates found in database.")
     logger_fn(f"Loaded {len(descriptions)} pricelist items from DB.")
@@ -237,114 +185,69 @@ def is_non_item(text):
 
 
 def load_inquiry_data(inquiry_path, logger_fn):
-    logger_fn("Reading inquiry file...")
-    try:
-        wb_inq = load_workbook(inquiry_path, read_only=False, data_only=False)
-    except Exception as e:
-        raise RuntimeError(f"Failed to open inquiry file: {e}")
-
-    items_to_fill = []
-    header_rows = {}
-    for sheet in wb_inq.worksheets:
-        logger_fn(f"Scanning inquiry sheet '{sheet.title}' for headers...")
-        desc_col = None
-        rate_col = None
-        qty_col = None
-        header_row_idx = None
-        for row_idx in range(1, 11):
-            for col_idx in range(1, sheet.max_column + 1):
-                cell_val = sheet.cell(row=row_idx, column=col_idx).value
-                if isinstance(cell_val, str):
-                    val_lower = cell_val.strip().lower()
-                    if val_lower == "description":
-                        desc_col = col_idx
-                    elif val_lower == "rate":
-                        rate_col = col_idx
-                    elif val_lower in ("qty", "quantity"):
-                        qty_col = col_idx
-            if desc_col and rate_col:
-                header_row_idx = row_idx
-                header_rows[sheet] = (header_row_idx, desc_col, rate_col, qty_col)
-                break
-        if not desc_col or not rate_col or header_row_idx is None:
-            logger_fn(f"Skipping sheet '{sheet.title}' (no valid headers).")
-            continue
-        logger_fn((f"Found headers in '{sheet.title}' at row {header_row_idx} "
-                  f"(Desc col={desc_col}, Rate col={rate_col}, Qty col={qty_col})."))
-        for r in range(header_row_idx + 1, sheet.max_row + 1):
-            desc_cell = sheet.cell(row=r, column=desc_col)
-            rate_cell = sheet.cell(row=r, column=rate_col)
-            qty_cell = sheet.cell(row=r, column=qty_col) if qty_col else None
-            if desc_cell.value is None or str(desc_cell.value).strip() == "":
-                continue
-            if is_non_item(desc_cell.value):
-                continue
-            if qty_col:
-                qty_val = qty_cell.value
-                if qty_val is None or str(qty_val).strip() == "":
-                    continue
-            if rate_cell.value not in (None, ""):
-                continue
-            items_to_fill.append((rate_cell, preprocess_text(str(desc_cell.value))))
-        logger_fn((f"Found {len([i for i in items_to_fill if i[0].parent == sheet])} items "
-                   f"to price in '{sheet.title}'."))
-    if not items_to_fill:
-        raise RuntimeError("No inquiry items with empty rates found in the inquiry file.")
-    return wb_inq, items_to_fill, header_rows
-
-def get_embeddings(text_list, model, logger_fn):
-    embeddings = []
-    for i in range(0, len(text_list), EMBEDDING_BATCH_SIZE):
-        batch = text_list[i : i + EMBEDDING_BATCH_SIZE]
-        logger_fn(f"Requesting batch {i//EMBEDDING_BATCH_SIZE + 1} from OpenAI...")
-        try:
-            response = openai.embeddings.create(model=model, input=batch)
-            if not hasattr(response, "data"):
-                raise RuntimeError("OpenAI response missing data.")
-            for item in response.data:
-                embeddings.append(item.embedding)
-        except Exception as e:
-            raise RuntimeError(f"OpenAI API call failed: {e}")
-        logger_fn("Received embeddings from API.")
-    return np.array(embeddings)
+    return scan_inquiry(inquiry_path, preprocess_text, logger_fn, skip_fn=is_non_item)
 
-def fill_inquiry_rates(wb_inq, items_to_fill, pricelist_descs, pricelist_rates, header_rows, model, logger_fn):
-    # Add two columns: Matched Description, Similarity Score
-    for sheet, (header_row, _, _, _) in header_rows.items():
-        base = sheet.max_column
-        sheet.cell(row=header_row, column=base + 1, value="Matched Description")
-        sheet.cell(row=header_row, column=base + 2, value="Similarity Score")
+def prepare_pricelist(provider, pricelist_descs, pricelist_rates, logger_fn):
+    """Embed and index the pricelist once, for any number of inquiries."""
     logger_fn("Computing embeddings for pricelist descriptions...")
-    pricelist_embeds = get_embeddings(pricelist_descs, model, logger_fn)
+    pricelist_embeds = provider.unit_matrix(pricelist_descs, "search_document", logger_fn)
+    vocab = TokenVocabulary(pricelist_descs)
+    index = None
+    if USE_ANN_INDEX:
+        index = load_or_build_index(pricelist_embeds, logger_fn)
+    elif EMBEDDING_STORAGE:
+        # Candidates from the compact codes, rescored from the float32 store
+        index = load_or_build_compact(pricelist_embeds, EMBEDDING_STORAGE, logger_fn,
+                                      CASCADE_DIMENSIONS)
+    return {
+        "descs": pricelist_descs,
+        "rates": pricelist_rates,
+        "unit": pricelist_embeds,
+        "vocab": vocab,
+        "tokens": vocab.encode(pricelist_descs),
+        "index": index,
+    }
+
+def match_inquiry(provider, pricelist, items_to_fill, header_rows, logger_fn):
+    # Add two columns: Matched Description, Similarity Score
+    cells, matched_cols = result_columns(header_rows, ["Matched Description", "Similarity Score"])
     logger_fn("Computing embeddings for inquiry descriptions...")
     inquiry_descs = [desc for (_cell, desc) in items_to_fill]
-    inquiry_embeds = get_embeddings(inquiry_descs, model, logger_fn)
-    pricelist_embeds = pricelist_embeds / np.linalg.norm(pricelist_embeds, axis=1, keepdims=True)
-    inquiry_embeds = inquiry_embeds / np.linalg.norm(inquiry_embeds, axis=1, keepdims=True)
+    # OpenAI embeds queries and documents alike, so inquiry lines share the
+    # pricelist's cache entries; each distinct description is embedded once
+    inquiry_embeds = provider.get(inquiry_descs, "search_query", logger_fn)
+    inquiry_embeds = normalize_rows(inquiry_embeds)
     logger_fn("Calculating similarity scores...")
-    similarity_matrix = inquiry_embeds.dot(pricelist_embeds.T)
-
-    token_pattern = re.compile(r"\b[a-zA-Z0-9]+\b")
-    price_tokens = [set(token_pattern.findall(t)) for t in pricelist_descs]
-    for idx, (rate_cell, desc_text) in enumerate(items_to_fill):
-        scores = similarity_matrix[idx]
-        query_tokens = set(token_pattern.findall(desc_text))
-        j_scores = np.array([
-            len(query_tokens & pt) / len(query_tokens | pt) if (query_tokens or pt) else 0
-            for pt in price_tokens
-        ])
-        combined = 0.85 * scores + 0.15 * j_scores
-        best_idx = np.argmax(combined)
-        best_score = combined[best_idx]
-        best_desc = pricelist_descs[best_idx]
-        best_rate = pricelist_rates[best_idx]
-        sheet = rate_cell.parent
-        matched_col = sheet.max_column - 1
-        score_col = sheet.max_column
-        rate_cell.value = best_rate
-        sheet.cell(row=rate_cell.row, column=matched_col).value = best_desc
-        sheet.cell(row=rate_cell.row, column=score_col).value = round(float(best_score), 3)
+    pricelist_embeds = pricelist["unit"]
+    query_tokens = pricelist["vocab"].encode(inquiry_descs)
+    price_tokens = pricelist["tokens"]
+    if pricelist["index"] is not None:
+        # Blend Jaccard into the approximate cosine candidates only
+        cand_idxs, cand_sims = pricelist["index"].search(inquiry_embeds, pricelist_embeds, ANN_CANDIDATES)
+        combined = 0.85 * cand_sims + 0.15 * jaccard_pairs(query_tokens, price_tokens, cand_idxs)
+        pick = combined.argmax(axis=1)[:, None]
+        best_idxs = np.take_along_axis(cand_idxs, pick, axis=1)
+        best_scores = np.take_along_axis(combined, pick, axis=1)
+    else:
+        blend = jaccard_blender(query_tokens, price_tokens, 0.85, 0.15)
+        best_idxs, best_scores = topk_similarity(inquiry_embeds, pricelist_embeds, 1, adjust=blend)
+    for idx, ((title, row, rate_col), desc_text) in enumerate(items_to_fill):
+        best_idx = best_idxs[idx, 0]
+        best_score = best_scores[idx, 0]
+        best_desc = pricelist["descs"][best_idx]
+        best_rate = pricelist["rates"][best_idx]
+        matched_col = matched_cols[title]
+        score_col = matched_col + 1
+        sheet_cells = cells[title]
+        sheet_cells[(row, rate_col)] = best_rate
+        sheet_cells[(row, matched_col)] = best_desc
+        sheet_cells[(row, score_col)] = round(float(best_score), 3)
     logger_fn("All items processed. Best matches and rates filled in.")
+    return cells
+
+def fill_inquiry_rates(provider, items_to_fill, pricelist_descs, pricelist_rates, header_rows, logger_fn):
+    pricelist = prepare_pricelist(provider, pricelist_descs, pricelist_rates, logger_fn)
+    return match_inquiry(provider, pricelist, items_to_fill, header_rows, logger_fn)
 
 if __name__ == "__main__":
     root = tk.Tk()
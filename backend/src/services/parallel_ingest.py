@@ -0,0 +1,258 @@
+"""parallel_ingest.py
+Process-pool ingestion of large price lists.
+
+Workbook sheets are cut into byte ranges at ``<row>`` boundaries of their
+sheet XML; CSV files are cut at record boundaries found by the csv parser
+itself, so quoted fields spanning lines stay whole. Each range is parsed in a
+worker process, which also runs the caller's per-row function (preprocessing,
+context strings). Results are merged in sheet and row order, so the output is
+the same as a serial read for any worker count.
+
+Row functions and their context are sent to the workers, so they must be
+module-level functions and picklable values.
+
+The workbook path drives openpyxl's private sheet parser (``WorkSheetParser``,
+``ReadOnlyWorksheet._get_row`` and the workbook's archive, shared strings and
+style tables); it is tested with openpyxl 3.1, which backend/requirements.txt
+pins. If those internals are missing, the sheets are read serially with
+``iter_rows`` instead: same results, one process.
+"""
+
+import csv
+import io
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+
+from openpyxl import load_workbook
+
+try:
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:  # Private API; ingest_workbook falls back to iter_rows
+    WorkSheetParser = None
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or os.cpu_count() or 1
+INGEST_CHUNK_BYTES = 2 << 20  # Sheet XML or CSV text per worker task
+
+ROOT_RE = re.compile(rb"<((?:[\w.-]+:)?)worksheet\b[^>]*>")
+
+
+def _run(tasks: list, fn, workers: int) -> list:
+    """Return ``fn(task)`` for every task, in task order."""
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        return [fn(task) for task in tasks]
+    # spawn as on Windows, and safe to use from the threaded pricing worker
+    with ProcessPoolExecutor(max_workers=workers,
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        return list(pool.map(fn, tasks))
+
+
+# --- Workbooks ---
+
+# Per process: the open workbook, kept across tasks, and the last sheet's XML
+_workbooks = {}  # path -> read-only workbook
+_sheet_xml = {}  # (path, title) -> sheet XML
+
+
+def _open_sheet(path: str, title: str) -> tuple:
+    if path not in _workbooks:
+        _close_workbooks()
+        _workbooks[path] = load_workbook(path, read_only=True, data_only=True)
+    ws = _workbooks[path][title]
+    key = (path, title)
+    if key not in _sheet_xml:
+        _sheet_xml.clear()
+        _sheet_xml[key] = ws.parent._archive.read(ws._worksheet_path)
+    return ws, _sheet_xml[key]
+
+
+def _close_workbooks() -> None:
+    for wb in _workbooks.values():
+        wb.close()
+    _workbooks.clear()
+    _sheet_xml.clear()
+
+
+def _sheet_ranges(data: bytes, chunk_bytes: int) -> tuple:
+    """Return ``(root, end_tag, ranges)`` splitting the sheet rows into chunks.
+
+    ``ranges`` holds ``(start, end, rows_before)`` byte ranges, each starting
+    at a row element; ``rows_before`` counts the rows ahead of it, for sheets
+    whose rows carry no ``r`` attribute.
+    """
+    root = ROOT_RE.search(data)
+    if root is None:
+        raise RuntimeError("Unrecognised worksheet XML")
+    prefix = root.group(1)
+    row_re = re.compile(b"<" + re.escape(prefix) + rb"row[\s>/]")
+    end_tag = b"</" + prefix + b"worksheet>"
+    body_end = data.rfind(b"</" + prefix + b"sheetData>")
+    first = row_re.search(data, root.end(), body_end) if body_end >= 0 else None
+    if first is None:
+        return root.group(0), end_tag, []
+    ranges = []
+    start = first.start()
+    rows_before = 0
+    while start < body_end:
+        nxt = row_re.search(data, start + chunk_bytes, body_end)
+        end = nxt.start() if nxt else body_end
+        ranges.append((start, end, rows_before))
+        rows_before += len(row_re.findall(data, start, end))
+        start = end
+    return root.group(0), end_tag, ranges
+
+
+def _parse_sheet_range(task) -> list:
+    path, title, root, end_tag, start, end, rows_before, first_row, row_fn, context = task
+    ws, data = _open_sheet(path, title)
+    src = io.BytesIO(root + data[start:end] + end_tag)
+    parser = WorkSheetParser(src, ws._shared_strings, data_only=True,
+                             epoch=ws.parent.epoch,
+                             date_formats=ws.parent._date_formats,
+                             timedelta_formats=ws.parent._timedelta_formats)
+    parser.row_counter = rows_before
+    results = []
+    for idx, cells in parser.parse():
+        if idx < first_row:
+            continue
+        if ws.max_row is not None and idx > ws.max_row:
+            break
+        # Same padding as ReadOnlyWorksheet.iter_rows(values_only=True)
+        values = ws._get_row(cells, max_col=ws.max_column, values_only=True)
+        result = row_fn(values, context)
+        if result is not None:
+            results.append(result)
+    return results
+
+
+def _open_workbook(path: str):
+    try:
+        return load_workbook(path, read_only=True, data_only=True)
+    except Exception as e:
+        raise RuntimeError(f"Failed to open pricelist file: {e}")
+
+
+def _read_workbook(path: str, header_fn, row_fn, logger_fn, header_rows: int) -> list:
+    """Serial ``ingest_workbook`` on openpyxl's public ``iter_rows``."""
+    wb = _open_workbook(path)
+    results = []
+    try:
+        for ws in wb.worksheets:
+            logger_fn(f"Processing pricelist sheet '{ws.title}'...")
+            header = header_fn(ws.title, list(ws.iter_rows(max_row=header_rows, values_only=True)))
+            if header is None:
+                continue
+            first_row, context = header
+            for values in ws.iter_rows(min_row=first_row, values_only=True):
+                # iter_rows fills gaps in the sheet XML with empty rows
+                if not values or all(v is None for v in values):
+                    continue
+                result = row_fn(values, context)
+                if result is not None:
+                    results.append(result)
+    finally:
+        wb.close()
+    return results
+
+
+def ingest_workbook(path: str, header_fn, row_fn, logger_fn, header_rows: int = 5,
+                    workers: int = INGEST_WORKERS,
+                    chunk_bytes: int = INGEST_CHUNK_BYTES) -> list:
+    """Return ``row_fn`` results for the data rows of every sheet, in order.
+
+    ``header_fn(title, rows)`` gets the first ``header_rows`` value tuples of
+    a sheet and returns ``(first_data_row, context)``, or None to skip the
+    sheet. ``row_fn(values, context)`` then runs in the workers on every row
+    from ``first_data_row`` on; rows it returns None for are dropped. Rows
+    absent from the sheet XML are not passed to ``row_fn`` (nor, in the
+    serial fallback, any row without values).
+    """
+    path = os.path.abspath(path)
+    if WorkSheetParser is None:
+        logger_fn("openpyxl sheet parser unavailable; reading the pricelist serially...")
+        return _read_workbook(path, header_fn, row_fn, logger_fn, header_rows)
+    wb = _open_workbook(path)
+
+    tasks = []
+    try:
+        with zipfile.ZipFile(path) as archive:
+            for ws in wb.worksheets:
+                logger_fn(f"Processing pricelist sheet '{ws.title}'...")
+                header = header_fn(ws.title, list(ws.iter_rows(max_row=header_rows, values_only=True)))
+                if header is None:
+                    continue
+                first_row, context = header
+                root, end_tag, ranges = _sheet_ranges(archive.read(ws._worksheet_path), chunk_bytes)
+                tasks.extend(
+                    (path, ws.title, root, end_tag, start, end, rows_before, first_row, row_fn, context)
+                    for start, end, rows_before in ranges
+                )
+    except (AttributeError, TypeError) as e:
+        # openpyxl internals changed; a real row_fn error re-raises serially
+        logger_fn(f"openpyxl sheet parser unsupported ({e}); reading the pricelist serially...")
+        return _read_workbook(path, header_fn, row_fn, logger_fn, header_rows)
+    finally:
+        wb.close()
+    logger_fn(f"Parsing {len(tasks)} row ranges on {max(1, min(workers, len(tasks)))} processes...")
+    try:
+        return list(chain.from_iterable(_run(tasks, _parse_sheet_range, workers)))
+    except (AttributeError, TypeError) as e:
+        logger_fn(f"openpyxl sheet parser unsupported ({e}); reading the pricelist serially...")
+        return _read_workbook(path, header_fn, row_fn, logger_fn, header_rows)
+    finally:
+        _close_workbooks()
+
+
+# --- CSV ---
+
+def _csv_ranges(text: str, chunk_chars: int) -> tuple:
+    """Return ``(header, chunks)`` with ``chunks`` holding whole CSV records."""
+    pos = 0
+
+    def consume():
+        nonlocal pos
+        # Split lines exactly as open(..., newline="") does
+        for line in io.StringIO(text, newline=""):
+            pos += len(line)
+            yield line
+
+    reader = csv.reader(consume())
+    header = next(reader, None)
+    chunks = []
+    start = pos
+    for _ in reader:
+        if pos - start >= chunk_chars:
+            chunks.append(text[start:pos])
+            start = pos
+    if pos > start:
+        chunks.append(text[start:pos])
+    return header, chunks
+
+
+def _parse_csv_range(task) -> list:
+    chunk, header, row_fn, context = task
+    results = []
+    for row in csv.DictReader(io.StringIO(chunk, newline=""), fieldnames=header):
+        result = row_fn(row, context)
+        if result is not None:
+            results.append(result)
+    return results
+
+
+def ingest_csv(path: str, row_fn, context=None, workers: int = INGEST_WORKERS,
+               chunk_bytes: int = INGEST_CHUNK_BYTES) -> list:
+    """Return ``row_fn(row, context)`` for every ``csv.DictReader`` row, in order.
+
+    Rows ``row_fn`` returns None for are dropped.
+    """
+    with open(path, newline="") as f:
+        text = f.read()
+    header, chunks = _csv_ranges(text, chunk_bytes)
+    if header is None:
+        return []
+    tasks = [(chunk, header, row_fn, context) for chunk in chunks]
+    return list(chain.from_iterable(_run(tasks, _parse_csv_range, workers)))
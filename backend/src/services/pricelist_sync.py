@@ -0,0 +1,136 @@
+"""pricelist_sync.py
+Incremental sync of the ``priceitems`` collection into a local snapshot.
+
+The snapshot keeps each priced document's preprocessed text and rate plus the
+newest ``updatedAt`` seen (the PriceItem schema has timestamps). Later runs
+only fetch documents updated since then and the list of ids still present.
+Deleted documents drop out, and unchanged rows reuse their processed text.
+
+Changes are found through ``updatedAt`` alone: documents without it, and
+raw updates that skip the timestamp (e.g. ``updateMany`` run outside
+Mongoose with ``timestamps`` off), are not picked up by incremental syncs.
+Delete the snapshot file (or bump ``SNAPSHOT_VERSION``) to force a full
+reload after such writes.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import threading
+from datetime import datetime
+
+from pymongo import MongoClient
+
+PRICELIST_SNAPSHOT_DIR = os.getenv(
+    "PRICELIST_SNAPSHOT_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "mjd", "pricelist"),
+)
+SNAPSHOT_VERSION = 1
+
+_clients: dict = {}
+_clients_lock = threading.Lock()
+
+
+def get_collection(uri: str, name: str = "priceitems"):
+    """Return ``name`` from the default database, reusing one client per URI."""
+    with _clients_lock:
+        client = _clients.get(uri)
+        if client is None:
+            client = _clients[uri] = MongoClient(uri)
+    return client.get_default_database()[name]
+
+
+def snapshot_path(uri: str, text_field: str, normalizer: str) -> str:
+    key = hashlib.sha256(f"{uri}\0{text_field}\0{normalizer}".encode("utf-8")).hexdigest()[:16]
+    return os.path.join(PRICELIST_SNAPSHOT_DIR, f"{key}.json")
+
+
+def normalizer_key(preprocess_fn) -> str:
+    """Identify a normalization by name and a hash of its module's source.
+
+    Memo wrappers are unwrapped. Any edit to the normalizer's module, such as a
+    changed rule, synonym table or ``NORMALIZER_VERSION``, yields a new key.
+    """
+    fn = inspect.unwrap(preprocess_fn)
+    try:
+        source = inspect.getsource(inspect.getmodule(fn))
+    except (OSError, TypeError):
+        source = ""
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+    return f"{fn.__module__}.{fn.__qualname__}:{digest}"
+
+
+def _is_priced(doc: dict, text_field: str) -> bool:
+    return (
+        doc.get("rate") is not None
+        and "unit" in doc
+        and doc["unit"] != ""
+        and bool(doc.get(text_field))
+    )
+
+
+def sync_pricelist(uri: str, text_field: str, preprocess_fn, logger_fn,
+                   normalizer: str = None) -> tuple:
+    """Return ``(descriptions, rates)`` of priced items, syncing the snapshot first.
+
+    ``text_field`` is the document field to embed and ``preprocess_fn`` the
+    normalization applied to it. ``normalizer`` identifies that normalization
+    (defaults to :func:`normalizer_key`); changing it forces a full reload so
+    stale processed texts are never reused. Items are returned in
+    ``_id`` order so the price list hashes the same way on every run.
+    """
+    normalizer = normalizer or normalizer_key(preprocess_fn)
+    path = snapshot_path(uri, text_field, normalizer)
+    col = get_collection(uri)
+
+    snapshot = None
+    if os.path.exists(path):
+        with open(path) as f:
+            snapshot = json.load(f)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            snapshot = None
+
+    projection = {text_field: 1, "rate": 1, "unit": 1, "updatedAt": 1}
+    if snapshot is None:
+        logger_fn("Loading full pricelist from database...")
+        items = {}
+        synced_at = None
+        cursor = col.find({}, projection)
+    else:
+        items = snapshot["items"]
+        synced_at = snapshot["synced_at"] and datetime.fromisoformat(snapshot["synced_at"])
+        present = {str(doc["_id"]) for doc in col.find({}, {"_id": 1})}
+        deleted = [key for key in items if key not in present]
+        for key in deleted:
+            del items[key]
+        # $gte so writes landing in the same millisecond as the last sync are not missed
+        query = {"updatedAt": {"$gte": synced_at}} if synced_at else {}
+        cursor = col.find(query, projection)
+        logger_fn(f"Syncing pricelist changes since {synced_at.isoformat() if synced_at else 'start'} "
+                  f"({len(deleted)} deleted)...")
+
+    changed = 0
+    for doc in cursor:
+        key = str(doc["_id"])
+        if _is_priced(doc, text_field):
+            items[key] = [preprocess_fn(doc[text_field]), doc["rate"]]
+        else:
+            items.pop(key, None)
+        changed += 1
+        updated = doc.get("updatedAt")
+        if updated is not None and (synced_at is None or updated > synced_at):
+            synced_at = updated
+    logger_fn(f"Applied {changed} new or updated pricelist documents.")
+
+    os.makedirs(PRICELIST_SNAPSHOT_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": SNAPSHOT_VERSION, "text_field": text_field,
+                   "normalizer": normalizer,
+                   "synced_at": synced_at.isoformat() if synced_at else None,
+                   "items": items}, f)
+    os.replace(tmp_path, path)
+
+    keys = sorted(items)
+    return [items[k][0] for k in keys], [items[k][1] for k in keys]
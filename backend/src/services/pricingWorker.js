@@ -0,0 +1,88 @@
+// src/services/pricingWorker.js
+// Keeps one Python pricing worker alive and talks to it over JSON lines
+
+import { spawn } from 'child_process';
+import readline from 'readline';
+import { fileURLToPath } from 'url';
+
+const WORKER_SCRIPT = fileURLToPath(new URL('./pricing_worker.py', import.meta.url));
+const PYTHON = process.env.PYTHON || 'python3';
+// A call that gets no reply within this time is failed and the worker restarted
+const WORKER_TIMEOUT_MS = Number(process.env.PRICING_WORKER_TIMEOUT_MS) || 120000;
+
+let worker = null;
+let nextId = 1;
+const pending = new Map();
+
+// Fail the calls waiting on one worker process
+function failPending(proc, err) {
+  for (const [id, call] of pending) {
+    if (call.proc !== proc) continue;
+    pending.delete(id);
+    clearTimeout(call.timer);
+    call.reject(err);
+  }
+}
+
+function discardWorker(proc, err) {
+  if (worker === proc) worker = null;
+  failPending(proc, err);
+  proc.kill();
+}
+
+function startWorker() {
+  const proc = spawn(PYTHON, [WORKER_SCRIPT], {
+    cwd: fileURLToPath(new URL('.', import.meta.url)),
+    stdio: ['pipe', 'pipe', 'pipe'],
+  });
+  let stderr = '';
+  proc.stderr.on('data', chunk => {
+    stderr = (stderr + chunk).slice(-4000);
+  });
+
+  readline.createInterface({ input: proc.stdout }).on('line', line => {
+    let msg;
+    try {
+      msg = JSON.parse(line);
+    } catch {
+      return;
+    }
+    const call = pending.get(msg.id);
+    if (!call) return;
+    pending.delete(msg.id);
+    clearTimeout(call.timer);
+    if (msg.error) call.reject(new Error(msg.error));
+    else call.resolve(msg.result);
+  });
+
+  // EPIPE when the worker died between or during writes
+  proc.stdin.on('error', err => discardWorker(proc, err));
+  proc.on('error', err => discardWorker(proc, err));
+  proc.on('exit', code => {
+    if (worker === proc) worker = null;
+    failPending(proc, new Error(stderr || `Pricing worker exited with code ${code}`));
+  });
+  return proc;
+}
+
+export function callWorker(method, params) {
+  if (!worker) worker = startWorker();
+  const proc = worker;
+  const id = nextId++;
+  return new Promise((resolve, reject) => {
+    const timer = setTimeout(() => {
+      // A hung worker would hold every later call too: replace it
+      discardWorker(proc, new Error(`Pricing worker timed out after ${WORKER_TIMEOUT_MS} ms`));
+      if (!worker) worker = startWorker();
+    }, WORKER_TIMEOUT_MS);
+    pending.set(id, { resolve, reject, proc, timer });
+    proc.stdin.write(JSON.stringify({ id, method, params }) + '\n');
+  });
+}
+
+export function stopWorker() {
+  if (worker) {
+    worker.stdin.end();
+    worker = null;
+  }
+}
@@ -1,16 +1,38 @@
 """pricing_engine.py
 Reads a master price Excel sheet and returns a lookup dictionary.
-This module relies on openpyxl; install via `pip install openpyxl`.
+This module relies on openpyxl and numpy; install via
+`pip install -r backend/requirements.txt` (or `pip install openpyxl numpy`).
+
+Parsed rate tables are compiled to columnar code/rate/cost arrays in
+RATE_CACHE_DIR, keyed by the source file's mtime, size and content hash, so
+repeat loads skip openpyxl entirely and rebuild only when the file changes.
+
+With ``--stream`` the CLI reads BoQ items as JSON lines and writes each priced
+item as a ``{"item": {...}}`` line as soon as its chunk is priced, followed by
+a ``{"total": ..., "overrides": [...]}`` trailer::
+
+    python pricing_engine.py rates.xlsx --stream < boq.ndjson
 """
 
 from pathlib import Path
 from openpyxl import load_workbook
 import csv
+import hashlib
+import json
+import math
 import os
+import sys
 from datetime import datetime
 
+import numpy as np
 
-def load_rates(path: str) -> dict:
+RATE_CACHE_DIR = os.getenv(
+    "RATE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "mjd", "rates")
+)
+STREAM_CHUNK_SIZE = 200   # BoQ items priced together in streaming mode
+
+
+def parse_rates(path: str) -> dict:
     """Return a mapping of code -> {rate, cost} supporting CSV or Excel."""
     ext = Path(path).suffix.lower()
     rates: dict = {}
@@ -30,23 +52,141 @@ def load_rates(path: str) -> dict:
                 }
         return rates
 
-    wb = load_workbook(path, data_only=True)
+    wb = load_workbook(path, read_only=True, data_only=True)
     ws = wb.active
     for row in ws.iter_rows(min_row=2, values_only=True):
-        code, rate, cost = row[0], row[1], None if len(row) < 3 else row[2]
+        if not row:
+            continue
+        code, rate, cost = row[0], row[1] if len(row) > 1 else None, None if len(row) < 3 else row[2]
         if code:
             rates[str(code).strip()] = {
                 "rate": float(rate or 0),
                 "cost": float(cost or 0),
             }
+    wb.close()
     return rates
 
 
+class RateTable:
+    """Columnar rate table: parallel code, rate and cost arrays."""
+
+    def __init__(self, codes: np.ndarray, rates: np.ndarray, costs: np.ndarray):
+        self.codes = codes
+        self.rates = rates
+        self.costs = costs
+
+    def __len__(self):
+        return len(self.codes)
+
+    def lookup(self, codes: list) -> np.ndarray:
+        """Return the row of each code in ``codes``, or -1 when absent."""
+        if not hasattr(self, "_rows"):
+            self._rows = dict(zip(self.codes.tolist(), range(len(self.codes))))
+        get = self._rows.get
+        return np.fromiter((get(c, -1) for c in codes), dtype=np.int64, count=len(codes))
+
+    @classmethod
+    def from_dict(cls, rates: dict):
+        return cls(
+            np.array(list(rates), dtype=np.str_),
+            np.array([r["rate"] for r in rates.values()], dtype=np.float64),
+            np.array([r["cost"] for r in rates.values()], dtype=np.float64),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            code: {"rate": rate, "cost": cost}
+            for code, rate, cost in zip(
+                self.codes.tolist(), self.rates.tolist(), self.costs.tolist()
+            )
+        }
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _save_table(cache_path: str, table: RateTable, stat, file_hash: str) -> None:
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path[:-4] + f".{os.getpid()}.tmp.npz"
+    try:
+        np.savez(
+            tmp_path,
+            codes=table.codes,
+            rates=table.rates,
+            costs=table.costs,
+            stamp=np.array([stat.st_mtime_ns, stat.st_size], dtype=np.int64),
+            hash=np.array(file_hash),
+        )
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _cache_failed(cache_path: str, error: OSError) -> None:
+    # The cache only saves parse time; price from the parsed table regardless.
+    # stderr, as stdout carries the worker's and --stream's JSON lines
+    print(f"Could not write rate cache {cache_path}: {error}", file=sys.stderr)
+
+
+def load_rate_table(path: str) -> RateTable:
+    """Return the rate table for ``path``, using the compiled cache when current."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]
+    cache_path = os.path.join(RATE_CACHE_DIR, f"{key}.npz")
+    file_hash = None
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as data:
+                cached = RateTable(data["codes"], data["rates"], data["costs"])
+                stamp = data["stamp"].tolist()
+                cached_hash = str(data["hash"])
+        except (OSError, ValueError, KeyError):
+            cached = None
+        if cached is not None:
+            if stamp == [stat.st_mtime_ns, stat.st_size]:
+                return cached
+            # Touched but maybe unchanged: compare content before reparsing
+            file_hash = _file_hash(path)
+            if file_hash == cached_hash:
+                try:
+                    _save_table(cache_path, cached, stat, file_hash)
+                except OSError as e:
+                    _cache_failed(cache_path, e)
+                return cached
+    table = RateTable.from_dict(parse_rates(path))
+    try:
+        _save_table(cache_path, table, stat, file_hash or _file_hash(path))
+    except OSError as e:
+        _cache_failed(cache_path, e)
+    return table
+
+
+def load_rates(path: str) -> dict:
+    """Return a mapping of code -> {rate, cost} supporting CSV or Excel."""
+    return load_rate_table(path).to_dict()
+
+
+def _float_or_nan(value) -> float:
+    """Return ``float(value)``, or NaN for missing and non-numeric values."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
 def apply_rates(boq: list, rates: dict) -> dict:
     """Populate unit rates, costs and profit margin for BoQ items.
 
     Returns a dictionary with the priced items, overall total and any rate
-    overrides detected during processing.
+    overrides detected during processing. Items whose quantity or unit rate is
+    missing or not a number get no total, profit or margin.
     """
     priced = []
     overrides = []
@@ -60,7 +200,7 @@ def apply_rates(boq: list, rates: dict) -> dict:
         if (
             item.get("unit_rate") is not None
             and rate is not None
-            and float(item["unit_rate"]) != float(rate)
+            and _float_or_nan(item["unit_rate"]) != float(rate)
         ):
             overrides.append(
                 {
@@ -74,9 +214,10 @@ def apply_rates(boq: list, rates: dict) -> dict:
         total = None
         profit = None
         margin = None
-        if unit_rate is not None and item.get("qty") is not None:
-            qty = float(item["qty"])
-            total = float(unit_rate) * qty
+        unit_value = _float_or_nan(unit_rate)
+        qty = _float_or_nan(item.get("qty"))
+        if not (math.isnan(unit_value) or math.isnan(qty)):
+            total = unit_value * qty
             if cost is not None:
                 profit = total - float(cost) * qty
                 if total:
@@ -97,15 +238,159 @@ def apply_rates(boq: list, rates: dict) -> dict:
 
     return {"items": priced, "total": job_total, "overrides": overrides}
 
+def apply_rates_batch(boq: list, table: RateTable) -> dict:
+    """Vectorized :func:`apply_rates` over a columnar :class:`RateTable`.
+
+    Looks up every code at once and computes totals, profit, margin and the
+    override mask on aligned NumPy columns. Returns the same shape and values
+    as :func:`apply_rates`, except that all overrides in one call share a
+    timestamp.
+    """
+    n = len(boq)
+    rows = table.lookup([item.get("code") for item in boq])
+    found = rows >= 0
+    rate = np.where(found, table.rates[np.maximum(rows, 0)] if len(table) else 0.0, np.nan)
+    cost = np.where(found, table.costs[np.maximum(rows, 0)] if len(table) else 0.0, np.nan)
+
+    given_rates = [item.get("unit_rate") for item in boq]
+    given = np.array([r is not None for r in given_rates], dtype=bool)
+    # Missing and non-numeric values become NaN and are masked out below
+    given_val = np.array([_float_or_nan(r) for r in given_rates], dtype=np.float64)
+    unit_rate = np.where(given, given_val, rate)
+    has_rate = ~np.isnan(unit_rate)
+
+    qty = np.array([_float_or_nan(item.get("qty")) for item in boq], dtype=np.float64)
+    has_qty = ~np.isnan(qty)
+
+    has_total = has_rate & has_qty
+    total = unit_rate * qty
+    has_profit = has_total & found
+    profit = total - cost * qty
+    has_margin = has_profit & (total != 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margin = (profit / total) * 100
+
+    override = given & found & (given_val != rate)
+    overrides = []
+    if override.any():
+        stamp = datetime.utcnow().isoformat()
+        overrides = [
+            {
+                "timestamp": stamp,
+                "code": boq[i].get("code"),
+                "default_rate": rate_i,
+                "override_rate": boq[i].get("unit_rate"),
+            }
+            for i, rate_i in zip(np.flatnonzero(override).tolist(), rate[override].tolist())
+        ]
+
+    def column(values, mask):
+        return np.where(mask, values.astype(object), None).tolist()
+
+    rate_col = column(rate, found)
+    unit_rate_col = [g if g is not None else r for g, r in zip(given_rates, rate_col)]
+    total_col = column(total, has_total)
+    priced = [
+        {**item, "unit_rate": u, "total": t, "cost_rate": c, "profit": p, "margin": m}
+        for item, u, t, c, p, m in zip(
+            boq, unit_rate_col, total_col, column(cost, found),
+            column(profit, has_profit), column(margin, has_margin),
+        )
+    ]
+
+    job_total = sum(t for t in total_col if t is not None)
+
+    return {"items": priced, "total": job_total, "overrides": overrides}
+
+
+def stream_rates(lines, table: RateTable, out, chunk_size: int = STREAM_CHUNK_SIZE) -> None:
+    """Price JSON-lines BoQ items from ``lines`` and write JSON lines to ``out``.
+
+    Items are priced ``chunk_size`` at a time with :func:`apply_rates_batch`
+    and written in input order, so memory stays bounded by one chunk plus the
+    overrides collected for the trailer.
+    """
+    job_total = 0
+    overrides = []
+    chunk = []
+
+    def flush():
+        nonlocal job_total
+        result = apply_rates_batch(chunk, table)
+        for item in result["items"]:
+            if item["total"] is not None:
+                job_total += item["total"]
+            out.write(json.dumps({"item": item}) + "\n")
+        overrides.extend(result["overrides"])
+        out.flush()
+        chunk.clear()
+
+    for line in lines:
+        if not line.strip():
+            continue
+        chunk.append(json.loads(line))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    out.write(json.dumps({"total": job_total, "overrides": overrides}) + "\n")
+    out.flush()
+
+
+def benchmark(lines: int = 100000, codes: int = 60000) -> None:
+    """Time :func:`apply_rates` against :func:`apply_rates_batch` on synthetic data."""
+    import time
+
+    rng = np.random.default_rng(0)
+    table = RateTable(
+        np.array([f"C{i:06d}" for i in range(codes)], dtype=np.str_),
+        np.round(rng.uniform(1, 500, codes), 2),
+        np.round(rng.uniform(0, 400, codes), 2),
+    )
+    boq = []
+    for i in range(lines):
+        item = {"code": f"C{rng.integers(0, codes * 1.1):06d}", "description": f"Item {i}",
+                "qty": float(rng.integers(1, 100)), "unit": "m2"}
+        if i % 10 == 0:
+            item["unit_rate"] = float(rng.integers(1, 500))
+        boq.append(item)
+
+    # Both timings start from the compiled table, as loaded by load_rate_table
+    start = time.perf_counter()
+    loop = apply_rates(boq, table.to_dict())
+    loop_s = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = apply_rates_batch(boq, table)
+    batch_s = time.perf_counter() - start
+
+    same = loop["items"] == batch["items"] and loop["total"] == batch["total"] and [
+        {k: v for k, v in o.items() if k != "timestamp"} for o in loop["overrides"]
+    ] == [{k: v for k, v in o.items() if k != "timestamp"} for o in batch["overrides"]]
+    print(f"{lines} lines, {codes} rate codes, {len(loop['overrides'])} overrides")
+    print(f"apply_rates:       {loop_s:.3f}s")
+    print(f"apply_rates_batch: {batch_s:.3f}s ({loop_s / batch_s:.1f}x)")
+    print(f"identical output:  {same}")
+
+
 if __name__ == "__main__":
-    import json
     import sys
 
-    rates = load_rates(sys.argv[1])
-    if len(sys.argv) > 2:
-        with open(sys.argv[2]) as f:
+    if sys.argv[1] == "--benchmark":
+        benchmark(*(int(a) for a in sys.argv[2:4]))
+        sys.exit(0)
+    args = [a for a in sys.argv[1:] if a != "--stream"]
+    table = load_rate_table(args[0])
+    if "--stream" in sys.argv:
+        if len(args) > 1:
+            with open(args[1]) as f:
+                stream_rates(f, table, sys.stdout)
+        else:
+            stream_rates(sys.stdin, table, sys.stdout)
+        sys.exit(0)
+    if len(args) > 1:
+        with open(args[1]) as f:
             items = json.load(f)
     else:
         items = json.load(sys.stdin)
-    result = apply_rates(items, rates)
-    json.dump(result, sys.stdout, indent=2)
\ No newline at end of file
+    result = apply_rates_batch(items, table)
+    json.dump(result, sys.stdout, indent=2)
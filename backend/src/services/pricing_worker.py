@@ -0,0 +1,149 @@
+"""pricing_worker.py
+Long-running JSON-lines RPC worker for the pricing engine and item matcher.
+
+Reads one request per line on stdin and writes one response per line on
+stdout, so a single Python process (with openpyxl imported and rate tables
+parsed) serves every call from Node::
+
+    {"id": 1, "method": "price", "params": {"rate_file": "...", "items": [...]}}
+    {"id": 1, "result": {"items": [...], "total": 123.0, "overrides": []}}
+
+Requests run on a thread pool and responses may arrive out of order; match
+them by ``id``. Errors come back as ``{"id": ..., "error": "message"}``,
+including results that cannot be encoded, so every request gets an answer.
+NaN and infinite numbers are sent as null, keeping each line valid JSON.
+Rate tables and indexed price lists stay cached until their file changes.
+"""
+
+import json
+import math
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time
+
+import numpy as np
+
+import item_matcher
+from pricing_engine import apply_rates_batch, load_rate_table
+
+WORKER_THREADS = int(os.getenv("PRICING_WORKER_THREADS", "4"))
+
+
+class FileCache:
+    """Caches a parsed file, reloading it when its mtime or size changes."""
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.entries: dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, path: str):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+        value = self.loader(path)
+        with self._lock:
+            self.entries[path] = (stamp, value)
+        return value
+
+
+rate_tables = FileCache(load_rate_table)
+price_lists = FileCache(item_matcher.load_price_list)
+
+
+def price(params: dict) -> dict:
+    return apply_rates_batch(params["items"], rate_tables.get(params["rate_file"]))
+
+
+def match(params: dict) -> list:
+    price_items, index = price_lists.get(params["price_file"])
+    return item_matcher.match_loaded(
+        price_items, index, item_matcher.load_input_items(params["input_file"])
+    )
+
+
+METHODS = {
+    "ping": lambda params: "pong",
+    "price": price,
+    "match": match,
+}
+
+
+def handle(line: str) -> dict:
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return {"id": None, "error": f"Invalid request: {e}"}
+    if not isinstance(request, dict):
+        return {"id": None, "error": "Invalid request: expected a JSON object"}
+    req_id = request.get("id")
+    method = METHODS.get(request.get("method"))
+    if method is None:
+        return {"id": req_id, "error": f"Unknown method: {request.get('method')}"}
+    try:
+        return {"id": req_id, "result": method(request.get("params") or {})}
+    except Exception as e:
+        return {"id": req_id, "error": str(e) or e.__class__.__name__}
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _finite(value):
+    """Return ``value`` with NaN and infinite floats replaced by None."""
+    if isinstance(value, dict):
+        return {k: _finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(v) for v in value]
+    if isinstance(value, (float, np.floating)) and not math.isfinite(value):
+        return None
+    return value
+
+
+def encode(response: dict) -> str:
+    """Serialize a response as one line of strict JSON."""
+    try:
+        return json.dumps(response, allow_nan=False, default=_json_default)
+    except ValueError:
+        # NaN or infinity somewhere; JSON.parse would reject the bare tokens
+        return json.dumps(_finite(response), allow_nan=False, default=_json_default)
+
+
+def respond_line(line: str) -> str:
+    """Return the response line for a request line; never raises."""
+    response = {"id": None}
+    try:
+        response = handle(line)
+        return encode(response)
+    except Exception as e:
+        return json.dumps({"id": response.get("id"), "error": str(e) or e.__class__.__name__})
+
+
+def main() -> None:
+    write_lock = threading.Lock()
+
+    def respond(line):
+        response = respond_line(line)
+        with write_lock:
+            sys.stdout.write(response + "\n")
+            sys.stdout.flush()
+
+    with ThreadPoolExecutor(max_workers=WORKER_THREADS) as pool:
+        for line in sys.stdin:
+            if line.strip():
+                pool.submit(respond, line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,28 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
-from sentence_transformers import SentenceTransformer # Changed from cohere
 import numpy as np
-from openpyxl import load_workbook
 import os
 import threading
 from datetime import datetime
 
+from compact_index import load_or_build_compact
+from embedding_store import normalize_rows
+from inquiry_io import result_columns, scan_inquiry, write_inquiry
+from local_models import local_provider
+from parallel_ingest import ingest_workbook
+from tk_log import TkLog
+from topk_search import topk_similarity
+
 # --- CONFIGURABLE CONSTANTS ---
 # Changed model to Qwen3-Embedding-8B from Hugging Face
 EMBEDDING_MODEL = "Qwen/Qwen3-Embedding-8B"
-EMBEDDING_BATCH_SIZE = 96
+EMBEDDING_BATCH_SIZE = 96        # Largest batch; sizes follow the memory budget in local_models
 # Qwen3-Embedding-8B supports up to 4096 dimensions. Keeping 1536 for compatibility.
 EMBEDDING_DIMENSION = 1536
+EMBEDDING_QUANTIZE = None        # "int8": dynamic int8 quantization, faster CPU encoding
+EMBEDDING_TRUNCATE = False       # Matryoshka-truncate vectors to EMBEDDING_DIMENSION
+EMBEDDING_STORAGE = None         # Compact codes: "float16", "int8", "binary" (memory only) or "matryoshka" (compact_index.py)
+CASCADE_DIMENSIONS = 256         # Prefix scanned in "matryoshka" mode before full-dimension rescoring
 
 class PricelistMatcherApp:
     def __init__(self, root):
@@ -72,6 +82,7 @@ class PricelistMatcherApp:
         tk.Label(frm, text="Progress:").grid(row=3, column=0, sticky="nw", pady=(10,0))
         self.log_box = scrolledtext.ScrolledText(frm, width=85, height=14, state="disabled", wrap=tk.WORD)
         self.log_box.grid(row=3, column=1, columnspan=2, pady=(10,0))
+        self.log = TkLog(self.root, self.log_box)
 
         # Process button (shifted row index)
         self.process_btn = tk.Button(
@@ -80,13 +91,6 @@ class PricelistMatcherApp:
         )
         self.process_btn.grid(row=4, column=1, pady=12, sticky="w")
 
-    def log(self, msg):
-        self.log_box.config(state="normal")
-        self.log_box.insert(tk.END, msg + "\n")
-        self.log_box.see(tk.END)
-        self.log_box.config(state="disabled")
-        self.root.update_idletasks()
-
     def get_auto_output_path(self):
         folder = self.output_folder.get()
         if not folder:
@@ -112,11 +116,13 @@ class PricelistMatcherApp:
             if not self.output_folder.get():
                 raise RuntimeError("Please specify an output folder.")
 
-            # Initialize SentenceTransformer model
-            self.log(f"Loading embedding model: {EMBEDDING_MODEL}. This may take a moment...")
+            # Load the SentenceTransformer model (once per process, see local_models.py)
             # Qwen3-Embedding-8B supports flexible output dimensions [2]
-            self.model = SentenceTransformer(EMBEDDING_MODEL)
-            self.log("Embedding model loaded successfully.")
+            provider = local_provider(EMBEDDING_MODEL, EMBEDDING_QUANTIZE,
+                                      EMBEDDING_DIMENSION if EMBEDDING_TRUNCATE else None,
+                                      EMBEDDING_DIMENSION, EMBEDDING_BATCH_SIZE, self.log)
+            self.model = provider.model_obj
+            self.log("Embedding model ready.")
 
             # Determine output path
             output_path = self.get_auto_output_path()
@@ -129,23 +135,21 @@ class PricelistMatcherApp:
             # Load data from Excel
             self.log("Starting processing...")
             price_descs, price_rates = load_pricelist_data(self.pricelist_path.get(), self.log)
-            wb_inq, items_to_fill, header_rows = load_inquiry_data(self.inquiry_path.get(), self.log)
+            items_to_fill, header_rows = load_inquiry_data(self.inquiry_path.get(), self.log)
 
             # Match and fill rates
-            fill_inquiry_rates(
-                model=self.model, # Changed from client
-                wb_inq=wb_inq,
+            cells = fill_inquiry_rates(
+                provider=provider,
                 items_to_fill=items_to_fill,
                 pricelist_descs=price_descs,
                 pricelist_rates=price_rates,
                 header_rows=header_rows,
                 logger_fn=self.log
             )
+            self.log(provider.metrics_line())
 
-            # Save and close workbook
-            self.log(f"Saving output file as: {output_path}")
-            wb_inq.save(output_path)
-            wb_inq.close()
+            # Write the filled cells into a copy of the inquiry
+            write_inquiry(self.inquiry_path.get(), output_path, cells, self.log)
             self.log("Output file saved.")
             messagebox.showinfo("Success", f"Pricing completed.\nOutput saved to:\n{output_path}")
 
@@ -169,157 +173,87 @@ def preprocess_text(s):
     s = s.replace("r.c.c.", "rcc").replace("reinforced cement concrete", "rcc")
     return s
 
+def pricelist_row(row, _context):
+    if not row or all(cell is None for cell in row):
+        return None
+    desc_val = row[1] if len(row) > 1 else row[0]
+    rate_val = row[-1]
+    if desc_val and rate_val not in (None, "", 0):
+        return preprocess_text(str(desc_val)), rate_val
+    return None
+
 def load_pricelist_data(pricelist_path, logger_fn):
     logger_fn("Reading pricelist file...")
-    try:
-        wb_price = load_workbook(pricelist_path, read_only=True, data_only=True)
-    except Exception as e:
-        raise RuntimeError(f"Failed to open pricelist file: {e}")
-
-    descriptions =
-    rates =
-    for sheet in wb_price.worksheets:
-        logger_fn(f"Processing pricelist sheet '{sheet.title}'...")
-        for row in sheet.iter_rows(values_only=True):
-            if not row or all(cell is None for cell in row):
-                continue
-            desc_val = row[1] if len(row) > 1 else row
-            rate_val = row[-1]
-            if desc_val and rate_val not in (None, "", 0):
-                descriptions.append(preprocess_text(str(desc_val)))
-                rates.append(rate_val)
-    wb_price.close()
+    # Every row of every sheet, parsed and preprocessed on a process pool
+    rows = ingest_workbook(pricelist_path, lambda title, head: (1, None), pricelist_row, logger_fn)
+    descriptions = [desc for desc, _ in rows]
+    rates = [rate for _, rate in rows]
     if not descriptions:
         raise RuntimeError("No item descriptions with rates found in pricelist file.")
     logger_fn(f"Loaded {len(descriptions)} pricelist items.")
     return descriptions, rates
 
 def load_inquiry_data(inquiry_path, logger_fn):
-    logger_fn("Reading inquiry file...")
-    try:
-        wb_inq = load_workbook(inquiry_path, read_only=False, data_only=False)
-    except Exception as e:
-        raise RuntimeError(f"Failed to open inquiry file: {e}")
-
-    items_to_fill =
-    header_rows  = {}
-    for sheet in wb_inq.worksheets:
-        logger_fn(f"Scanning inquiry sheet '{sheet.title}' for headers...")
-        desc_col = rate_col = qty_col = None
-        header_row_idx = None
-        for row_idx in range(1, 11):
-            for col_idx in range(1, sheet.max_column + 1):
-                val = sheet.cell(row=row_idx, column=col_idx).value
-                if isinstance(val, str):
-                    low = val.strip().lower()
-                    if low == "description":
-                        desc_col = col_idx
-                    elif low == "rate":
-                        rate_col = col_idx
-                    elif low in ("qty", "quantity"):
-                        qty_col = col_idx
-            if desc_col and rate_col:
-                header_row_idx = row_idx
-                header_rows[sheet] = (header_row_idx, desc_col, rate_col, qty_col)
-                break
-        if not desc_col or not rate_col:
-            logger_fn(f"Skipping sheet '{sheet.title}' (no valid headers).")
-            continue
-        logger_fn((f"Found headers in '{sheet.title}' at row {header_row_idx} "
-                      f"(Desc col={desc_col}, Rate col={rate_col}, Qty col={qty_col})."))
-        for r in range(header_row_idx + 1, sheet.max_row + 1):
-            desc_cell = sheet.cell(row=r, column=desc_col)
-            rate_cell = sheet.cell(row=r, column=rate_col)
-            qty_cell  = sheet.cell(row=r, column=qty_col) if qty_col else None
-            if not desc_cell.value or str(desc_cell.value).strip() == "":
-                continue
-            if qty_col and (qty_cell.value is None or str(qty_cell.value).strip() == ""):
-                continue
-            if rate_cell.value not in (None, ""):
-                continue
-            items_to_fill.append((rate_cell, preprocess_text(str(desc_cell.value))))
-        cnt = len([i for i in items_to_fill if i.parent == sheet])
-        logger_fn(f"Found {cnt} items to price in '{sheet.title}'.")
-    if not items_to_fill:
-        raise RuntimeError("No inquiry items with empty rates found in the inquiry file.")
-    return wb_inq, items_to_fill, header_rows
-
-# Modified get_embeddings to use SentenceTransformer
-def get_embeddings(model, texts, logger_fn, input_type="search_document"):
-    embeddings =
-    # Qwen3-Embedding models are instruction-aware
-    # Prepend instructions based on input_type for optimal performance
-    if input_type == "search_document":
-        prefixed_texts = [f"passage: {text}" for text in texts]
-    elif input_type == "search_query":
-        prefixed_texts = [f"query: {text}" for text in texts]
-    else:
-        prefixed_texts = texts # Fallback for other types
-
-    for i in range(0, len(prefixed_texts), EMBEDDING_BATCH_SIZE):
-        batch = prefixed_texts
-        logger_fn(f"Requesting batch {i//EMBEDDING_BATCH_SIZE + 1} from model...")
-        try:
-            # SentenceTransformer's encode method handles batching and returns numpy array
-            # Qwen3-Embedding-8B supports flexible output dimensions [2]
-            # The model loaded by SentenceTransformer will handle the dimension
-            batch_embeddings = model.encode(batch, convert_to_numpy=True, normalize_embeddings=False)
-            embeddings.extend(batch_embeddings)
-        except Exception as e:
-            raise RuntimeError(f"Embedding model call failed: {e}")
-        logger_fn("Received embeddings.")
-    return np.array(embeddings)
+    return scan_inquiry(inquiry_path, preprocess_text, logger_fn)
 
-def fill_inquiry_rates(model, wb_inq, items_to_fill, # Changed client to model
-                        pricelist_descs, pricelist_rates,
-                        header_rows, logger_fn): # Removed model parameter as it's passed directly now
-    # Add columns for matched description & similarity
-    for sheet, (hdr, _, _, _) in header_rows.items():
-        base = sheet.max_column
-        sheet.cell(row=hdr, column=base+1, value="Matched Description")
-        sheet.cell(row=hdr, column=base+2, value="Similarity Score")
-
-    # Embed pricelist (documents)
+def prepare_pricelist(provider, pricelist_descs, pricelist_rates, logger_fn):
+    """Embed the pricelist once, for any number of inquiries."""
+    # Embed pricelist (documents) into a memory-mapped unit matrix,
+    # reusing cached vectors for unchanged rows
     logger_fn("Computing embeddings for pricelist descriptions...")
-    pricelist_embeds = get_embeddings(
-        model, pricelist_descs, logger_fn, input_type="search_document"
-    )
+    unit = provider.unit_matrix(pricelist_descs, "search_document", logger_fn)
+    return {
+        "descs": pricelist_descs,
+        "rates": pricelist_rates,
+        "unit": unit,
+        # Candidates from the compact codes, rescored from the float32 store
+        "index": load_or_build_compact(unit, EMBEDDING_STORAGE, logger_fn, CASCADE_DIMENSIONS)
+                 if EMBEDDING_STORAGE else None,
+    }
+
+def match_inquiry(provider, pricelist, items_to_fill, header_rows, logger_fn):
+    # Add columns for matched description & similarity
+    cells, matched_cols = result_columns(header_rows, ["Matched Description", "Similarity Score"])
 
-    # Embed inquiry (queries)
+    # Embed inquiry (queries), each distinct description once across runs
     logger_fn("Computing embeddings for inquiry descriptions...")
     inquiry_texts   = [desc for (_cell, desc) in items_to_fill]
-    inquiry_embeds  = get_embeddings(
-        model, inquiry_texts, logger_fn, input_type="search_query"
-    )
+    inquiry_embeds  = provider.get(inquiry_texts, "search_query", logger_fn)
 
     # Normalize for cosine similarity
     # SentenceTransformer's encode method can return normalized embeddings if convert_to_tensor=True and normalize_embeddings=True
     # However, for consistency with original code's explicit normalization, keeping it here.
-    pricelist_norms = np.linalg.norm(pricelist_embeds, axis=1, keepdims=True)
-    inquiry_norms   = np.linalg.norm(inquiry_embeds, axis=1, keepdims=True)
-    pricelist_unit  = pricelist_embeds / pricelist_norms
-    inquiry_unit    = inquiry_embeds    / inquiry_norms
+    inquiry_unit    = normalize_rows(inquiry_embeds)
 
     logger_fn("Calculating similarity scores...")
-    sim_matrix = inquiry_unit.dot(pricelist_unit.T)
+    if pricelist["index"] is not None:
+        best_idxs, best_scores = pricelist["index"].search(inquiry_unit, pricelist["unit"], 1)
+    else:
+        best_idxs, best_scores = topk_similarity(inquiry_unit, pricelist["unit"], 1)
 
     # Fill in best match and rate
-    for idx, (rate_cell, _) in enumerate(items_to_fill):
-        sims       = sim_matrix[idx]
-        best_idx   = sims.argmax()
-        best_score = float(sims[best_idx])
-        best_desc  = pricelist_descs[best_idx]
-        best_rate  = pricelist_rates[best_idx]
+    for idx, ((title, row, rate_c), _) in enumerate(items_to_fill):
+        best_idx   = best_idxs[idx, 0]
+        best_score = float(best_scores[idx, 0])
+        best_desc  = pricelist["descs"][best_idx]
+        best_rate  = pricelist["rates"][best_idx]
 
-        sheet      = rate_cell.parent
-        matched_c  = sheet.max_column - 1
-        score_c    = sheet.max_column
+        matched_c  = matched_cols[title]
+        score_c    = matched_c + 1
 
-        rate_cell.value = best_rate
-        sheet.cell(row=rate_cell.row, column=matched_c).value = best_desc
-        sheet.cell(row=rate_cell.row, column=score_c).value = round(best_score, 3)
+        sheet_cells = cells[title]
+        sheet_cells[(row, rate_c)] = best_rate
+        sheet_cells[(row, matched_c)] = best_desc
+        sheet_cells[(row, score_c)] = round(best_score, 3)
 
     logger_fn("All items processed. Best matches and rates filled in.")
+    return cells
+
+def fill_inquiry_rates(provider, items_to_fill,
+                        pricelist_descs, pricelist_rates,
+                        header_rows, logger_fn):
+    pricelist = prepare_pricelist(provider, pricelist_descs, pricelist_rates, logger_fn)
+    return match_inquiry(provider, pricelist, items_to_fill, header_rows, logger_fn)
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,147 @@
+"""text_memo.py
+Bounded memoization of text normalization and tokenization.
+
+BoQs repeat descriptions heavily ("ditto", standard clauses across sheets and
+tenders). :class:`TextMemo` wraps a ``str -> value`` function with an LRU of
+``maxsize`` entries and counts hits, misses and evictions so the size can be
+tuned from the logged :meth:`TextMemo.stats_line`.
+
+With ``store`` set, string results are also kept in a SQLite file shared
+between matcher runs: the most recently used entries are loaded into the LRU
+on first use and :meth:`TextMemo.flush` writes back what the run used. Entries
+are namespaced by the wrapped function's qualified name and a ``version`` to
+bump whenever its output changes. The store is off unless ``TEXT_MEMO_STORE``
+is set: reading 100k entries back takes about twice as long as running
+``text_normalizer.normalize_text`` on them, so it only pays for slower
+functions.
+"""
+
+import functools
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+TEXT_MEMO_SIZE = int(os.getenv("TEXT_MEMO_SIZE", "100000"))
+TEXT_MEMO_STORE = os.getenv("TEXT_MEMO_STORE", "")  # e.g. ~/.cache/mjd/text_memo.sqlite
+STORE_MAX_ROWS = 1000000  # Per namespace; least recently used rows are pruned on flush
+
+
+class TextMemo:
+    """LRU-memoized ``fn(text)``, optionally backed by a shared SQLite store."""
+
+    def __init__(self, fn, maxsize: int = TEXT_MEMO_SIZE, store: str = None, version: int = 1):
+        functools.update_wrapper(self, fn)
+        self.fn = fn
+        self.maxsize = maxsize
+        self.store = store or None
+        self.namespace = f"{fn.__module__}.{fn.__qualname__}:{version}"
+        self._entries = OrderedDict()
+        self._used = set()  # Keys looked up since the last flush
+        self._loaded = self.store is None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.preloaded = 0
+
+    def __call__(self, text):
+        if not self._loaded:
+            self.load()
+        with self._lock:
+            value = self._entries.get(text, self)
+            if value is not self:
+                self._entries.move_to_end(text)
+                self.hits += 1
+                if self.store:
+                    self._used.add(text)
+                return value
+            self.misses += 1
+        value = self.fn(text)
+        with self._lock:
+            self._entries[text] = value
+            if self.store:
+                self._used.add(text)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def map(self, texts) -> list:
+        """Return ``[self(text) for text in texts]``."""
+        return [self(text) for text in texts]
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.store)), exist_ok=True)
+        conn = sqlite3.connect(self.store, timeout=30)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS memo (namespace TEXT, key TEXT, value TEXT,"
+            " used REAL, PRIMARY KEY (namespace, key))"
+        )
+        return conn
+
+    def load(self) -> None:
+        """Fill the LRU with the store's most recently used entries."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                conn = self._connect()
+                try:
+                    rows = conn.execute(
+                        "SELECT key, value FROM memo WHERE namespace = ? ORDER BY used DESC LIMIT ?",
+                        (self.namespace, self.maxsize),
+                    ).fetchall()
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                self.store = None  # Unreadable store: run in memory only
+                return
+            # Oldest first, so the LRU order matches the store's
+            for key, value in reversed(rows):
+                self._entries.setdefault(key, value)
+            self.preloaded = len(rows)
+
+    def flush(self) -> None:
+        """Write the entries used since the last flush to the store."""
+        if not self.store:
+            return
+        with self._lock:
+            rows = [(self.namespace, key, self._entries[key], time.time())
+                    for key in self._used
+                    if key in self._entries and isinstance(key, str)
+                    and isinstance(self._entries[key], str)]
+            self._used.clear()
+        if not rows:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO memo VALUES (?, ?, ?, ?)", rows)
+                    conn.execute(
+                        "DELETE FROM memo WHERE namespace = ? AND key IN (SELECT key FROM memo"
+                        " WHERE namespace = ? ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                        (self.namespace, self.namespace, STORE_MAX_ROWS),
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass  # The store is only an optimization
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "preloaded": self.preloaded,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    def stats_line(self) -> str:
+        s = self.stats()
+        return (f"{self.__name__} memo: {s['hits']} hits, {s['misses']} misses "
+                f"({s['hit_rate']:.1%} hit rate), {s['evictions']} evictions, "
+                f"{s['size']}/{s['maxsize']} entries ({s['preloaded']} preloaded)")
@@ -0,0 +1,172 @@
+"""text_normalizer.py
+Single-pass description normalization for the embedding matchers.
+
+Gives the same output as the matchers' former regex pipeline (strip
+punctuation, numbers and units, map synonyms, strip plural/verb suffixes,
+drop stop words), but tokenizes each string once and looks every token up in
+a memo of its final form, so repeated words cost a dict lookup.
+
+``python text_normalizer.py --check`` verifies the golden corpus in
+``text_normalizer_golden.json``; ``--benchmark`` times both implementations.
+"""
+
+import os
+import re
+
+SYNONYM_MAP = {
+    "bricks": "brick",
+    "brickwork": "brick",
+    "blocks": "brick",
+    "blockwork": "brick",
+    "cement": "concrete",
+    "concrete": "concrete",
+    "footing": "foundation",
+    "footings": "foundation",
+    "excavation": "excavate",
+    "excavations": "excavate",
+    "excavate": "excavate",
+    "dig": "excavate",
+    "installation": "install",
+    "installing": "install",
+    "installed": "install",
+    "demolition": "demolish",
+    "demolish": "demolish",
+    "demolishing": "demolish",
+    "remove": "demolish",
+    "supply": "provide",
+    "supplies": "provide",
+    "providing": "provide",
+}
+
+STOP_WORDS = {
+    "the","and","of","to","in","for","on","at","by","from","with",
+    "a","an","be","is","are","as","it","its","into","or",
+}
+
+# Dropped unless they open the string
+UNIT_TOKENS = {"mm", "cm", "m", "inch", "in", "ft"}
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "text_normalizer_golden.json")
+TOKEN_MEMO_SIZE = 200000  # Distinct tokens remembered before the memo is reset
+
+SUFFIX_RE = re.compile(r"(ings|ing|ed|es|s)$")
+# Lowercased text is encoded to ASCII and every byte except [a-z0-9] mapped
+# to a space, so a plain split() yields the tokens
+SEPARATORS = bytes(c if chr(c).isascii() and (chr(c).islower() or chr(c).isdigit()) else 32
+                   for c in range(256))
+UNIT_BYTES = {unit.encode() for unit in UNIT_TOKENS}
+
+NORMALIZER_VERSION = 1  # Bump when the output changes; keys persisted memo entries
+
+
+def _normalize_token(token: str) -> str:
+    if token.isdigit():
+        return ""
+    w = SYNONYM_MAP.get(token, token)
+    if len(w) > 3:
+        w = SUFFIX_RE.sub("", w)
+    return "" if w in STOP_WORDS else w
+
+
+class _TokenMemo(dict):
+    """ASCII token -> normalized token plus a space, "" when dropped.
+
+    Units are always dropped here; the caller handles a leading unit.
+    """
+
+    def __missing__(self, token: bytes) -> str:
+        w = "" if token in UNIT_BYTES else _normalize_token(token.decode())
+        w = self[token] = w and w + " "
+        return w
+
+
+_memo = _TokenMemo()
+
+
+def normalize_texts(texts) -> list:
+    """Return :func:`normalize_text` of every item of ``texts``."""
+    if len(_memo) > TOKEN_MEMO_SIZE:
+        _memo.clear()
+    lookup = _memo.__getitem__
+    out = []
+    for s in texts:
+        if not s:
+            out.append("")
+            continue
+        b = str(s).lower().encode("ascii", "replace").translate(SEPARATORS)
+        tokens = b.split()
+        text = "".join(map(lookup, tokens))[:-1]
+        # A unit is only kept when it opens the string
+        if tokens and b[0] != 32 and tokens[0] in UNIT_BYTES:
+            text = " ".join(filter(None, (_normalize_token(tokens[0].decode()), text)))
+        out.append(text)
+    return out
+
+
+def normalize_text(s) -> str:
+    """Normalize one description for embedding and Jaccard scoring."""
+    return normalize_texts((s,))[0]
+
+
+def _reference_normalize(s) -> str:
+    """The former multi-pass implementation, kept for --check and --benchmark."""
+    if not s:
+        return ""
+    s = str(s).lower()
+    s = re.sub(r"[^a-z0-9\s]", " ", s)
+    s = re.sub(r"\b\d+(?:\.\d+)?\b", " ", s)
+    s = re.sub(r"\s+(mm|cm|m|inch|in|ft)\b", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+    parts = []
+    for w in s.split():
+        w = SYNONYM_MAP.get(w, w)
+        if len(w) > 3:
+            w = re.sub(r"(ings|ing|ed|es|s)$", "", w)
+        parts.append(w)
+    return " ".join([w for w in parts if w and w not in STOP_WORDS])
+
+
+def check(path: str = GOLDEN_PATH) -> int:
+    """Compare both implementations with the golden corpus; return the mismatch count."""
+    import json
+
+    with open(path, encoding="utf-8") as f:
+        cases = json.load(f)
+    texts = [text for text, _ in cases]
+    failures = 0
+    for (text, expected), got in zip(cases, normalize_texts(texts)):
+        ref = _reference_normalize(text)
+        if got != expected or ref != expected:
+            failures += 1
+            print(f"MISMATCH {text!r}: expected {expected!r}, got {got!r}, reference {ref!r}")
+    print(f"{len(cases)} golden cases, {failures} mismatches")
+    return failures
+
+
+def benchmark(path: str = GOLDEN_PATH, repeat: int = 200) -> None:
+    """Time the reference pipeline against :func:`normalize_texts`."""
+    import json
+    import time
+
+    with open(path, encoding="utf-8") as f:
+        texts = [text for text, _ in json.load(f)] * repeat
+    start = time.perf_counter()
+    ref = [_reference_normalize(t) for t in texts]
+    ref_s = time.perf_counter() - start
+    _memo.clear()
+    start = time.perf_counter()
+    new = normalize_texts(texts)
+    new_s = time.perf_counter() - start
+    print(f"{len(texts)} texts")
+    print(f"reference:       {ref_s:.3f}s")
+    print(f"normalize_texts: {new_s:.3f}s ({ref_s / new_s:.1f}x)")
+    print(f"identical output: {ref == new}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:2] == ["--benchmark"]:
+        benchmark()
+    else:
+        sys.exit(1 if check() else 0)
@@ -0,0 +1,40 @@
+"""tk_log.py
+Thread-safe progress log for the Tkinter matcher apps.
+
+Matching runs on a worker thread, and Tk widgets must only be touched from
+the thread running the event loop. :class:`TkLog` queues messages from any
+thread and the event loop appends them to the text widget every
+``POLL_MS`` milliseconds, in batches.
+"""
+
+import queue
+import tkinter as tk
+
+POLL_MS = 100
+
+
+class TkLog:
+    """Callable ``log(msg)`` writing to a read-only ``ScrolledText`` widget."""
+
+    def __init__(self, root, widget):
+        self.root = root
+        self.widget = widget
+        self._queue = queue.SimpleQueue()
+        root.after(POLL_MS, self._drain)
+
+    def __call__(self, msg: str) -> None:
+        self._queue.put(msg)
+
+    def _drain(self) -> None:
+        lines = []
+        while True:
+            try:
+                lines.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if lines:
+            self.widget.config(state="normal")
+            self.widget.insert(tk.END, "\n".join(lines) + "\n")
+            self.widget.see(tk.END)
+            self.widget.config(state="disabled")
+        self.root.after(POLL_MS, self._drain)
@@ -0,0 +1,115 @@
+"""token_vocab.py
+Shared token vocabulary for Jaccard scoring over normalized descriptions.
+
+Descriptions are encoded as sparse binary rows (one column per token), so the
+token overlap of a batch of queries with the whole price list is a single
+sparse matrix product. Requires numpy and scipy.
+"""
+
+import numpy as np
+from scipy import sparse
+
+from text_memo import TextMemo
+
+
+@TextMemo
+def tokenize(text: str) -> frozenset:
+    """Return the distinct tokens of an already normalized description."""
+    return frozenset(text.split())
+
+
+class TokenVocabulary:
+    """Maps tokens to column numbers and encodes texts as CSR rows."""
+
+    def __init__(self, texts=()):
+        self.columns: dict = {}
+        for text in texts:
+            for token in tokenize(text):
+                self.columns.setdefault(token, len(self.columns))
+
+    def __len__(self):
+        return len(self.columns)
+
+    def encode(self, texts) -> tuple:
+        """Return ``(matrix, sizes)`` for ``texts``.
+
+        ``matrix`` is a binary CSR matrix over the known tokens and ``sizes``
+        holds each text's distinct token count, including tokens outside the
+        vocabulary, so unions stay exact for unseen query words.
+        """
+        indptr = [0]
+        indices = []
+        sizes = []
+        for text in texts:
+            tokens = tokenize(text)
+            cols = sorted(self.columns[t] for t in tokens if t in self.columns)
+            indices.extend(cols)
+            indptr.append(len(indices))
+            sizes.append(len(tokens))
+        matrix = sparse.csr_matrix(
+            (
+                np.ones(len(indices), dtype=np.int32),
+                np.asarray(indices, dtype=np.int32),
+                np.asarray(indptr, dtype=np.int64),
+            ),
+            shape=(len(sizes), len(self.columns)),
+        )
+        return matrix, np.asarray(sizes, dtype=np.int64)
+
+
+def jaccard_scores(queries: tuple, docs: tuple):
+    """Return the query x doc Jaccard similarities as a CSR matrix.
+
+    ``queries`` and ``docs`` are ``(matrix, sizes)`` pairs from the same
+    :class:`TokenVocabulary`. Pairs sharing no token are left out of the
+    sparse structure; their score is 0, as is any pair with an empty side.
+    """
+    q_matrix, q_sizes = queries
+    d_matrix, d_sizes = docs
+    overlap = (q_matrix @ d_matrix.T).tocsr()
+    overlap.sort_indices()
+    rows = np.repeat(np.arange(overlap.shape[0]), np.diff(overlap.indptr))
+    inter = overlap.data.astype(np.float64)
+    union = q_sizes[rows] + d_sizes[overlap.indices] - inter
+    return sparse.csr_matrix(
+        (inter / union, overlap.indices, overlap.indptr), shape=overlap.shape
+    )
+
+
+def jaccard_blender(queries: tuple, docs: tuple, cosine_weight: float, jaccard_weight: float):
+    """Return an ``adjust`` callback for :func:`topk_search.topk_similarity`.
+
+    The callback turns a block of cosine scores into
+    ``cosine_weight * cosine + jaccard_weight * jaccard`` in place, scoring
+    Jaccard for just that block of query rows.
+    """
+    q_matrix, q_sizes = queries
+
+    def blend(start, stop, scores):
+        block = (q_matrix[start:stop], q_sizes[start:stop])
+        j_matrix = jaccard_scores(block, docs).tocoo()
+        scores *= cosine_weight
+        scores[j_matrix.row, j_matrix.col] += jaccard_weight * j_matrix.data
+
+    return blend
+
+
+def jaccard_pairs(queries: tuple, docs: tuple, doc_idx: np.ndarray) -> np.ndarray:
+    """Return the Jaccard of each query with the docs listed in its row of ``doc_idx``.
+
+    ``doc_idx`` is an ``(n_queries, k)`` array of doc positions, as returned by
+    a candidate search; entries of -1 (no candidate) score 0.
+    """
+    q_matrix, q_sizes = queries
+    d_matrix, d_sizes = docs
+    n, k = doc_idx.shape
+    rows = np.repeat(np.arange(n), k)
+    cols = doc_idx.ravel()
+    valid = cols >= 0
+    rows, cols = rows[valid], cols[valid]
+    inter = np.asarray(q_matrix[rows].multiply(d_matrix[cols]).sum(axis=1), dtype=np.float64).ravel()
+    union = q_sizes[rows] + d_sizes[cols] - inter
+    out = np.zeros(n * k)
+    nonzero = inter > 0
+    out[np.flatnonzero(valid)[nonzero]] = inter[nonzero] / union[nonzero]
+    return out.reshape(n, k)
@@ -0,0 +1,68 @@
+"""topk_search.py
+Blocked top-k similarity search over unit embedding matrices.
+
+Query rows are streamed through a single matrix product (BLAS GEMM) per
+block, and only the k best price items per row are kept, so memory stays
+bounded by ``SEARCH_BLOCK_BYTES`` instead of growing with queries x items.
+"""
+
+import numpy as np
+
+SEARCH_BLOCK_BYTES = 256 * 1024 * 1024  # Upper bound on one block of scores
+
+
+def block_rows(n_corpus: int, itemsize: int, max_bytes: int = SEARCH_BLOCK_BYTES) -> int:
+    """Return how many query rows fit in one block of scores."""
+    return max(1, max_bytes // max(1, n_corpus * itemsize))
+
+
+def select_topk(scores: np.ndarray, k: int) -> tuple:
+    """Return ``(indices, values)`` of the k best columns of each row.
+
+    Columns are ordered best first, with ties broken by lower index. For
+    ``k == 1`` the result matches ``scores.argmax(axis=1)`` exactly.
+    """
+    n, m = scores.shape
+    k = min(k, m)
+    if k == 1:
+        idx = scores.argmax(axis=1)[:, None]
+    else:
+        if k < m:
+            idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            # argpartition keeps an arbitrary subset of the values tied at the
+            # k-th place; rows with such ties get a full stable sort instead
+            kth = np.take_along_axis(scores, idx, axis=1).min(axis=1)
+            tied = np.flatnonzero((scores >= kth[:, None]).sum(axis=1) > k)
+            if len(tied):
+                idx[tied] = np.argsort(-scores[tied], axis=1, kind="stable")[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(m), (n, m))
+        vals = np.take_along_axis(scores, idx, axis=1)
+        order = np.lexsort((idx, -vals), axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+    return idx, np.take_along_axis(scores, idx, axis=1)
+
+
+def topk_similarity(queries, corpus, k: int, adjust=None,
+                    max_bytes: int = SEARCH_BLOCK_BYTES) -> tuple:
+    """Return the k best corpus rows for every query row.
+
+    ``queries`` and ``corpus`` hold unit-length rows (``corpus`` may be a
+    memory map). ``adjust(start, stop, scores)`` may rewrite a block of
+    cosine scores in place before selection, e.g. to blend in Jaccard.
+    Returns ``(indices, scores)`` arrays of shape ``(len(queries), k)``.
+    """
+    n = len(queries)
+    dtype = np.result_type(queries.dtype, corpus.dtype)
+    k = min(k, len(corpus))
+    indices = np.empty((n, k), dtype=np.int64)
+    scores = np.empty((n, k), dtype=dtype)
+    step = block_rows(len(corpus), dtype.itemsize, max_bytes)
+    corpus_t = corpus.T
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        block = queries[start:stop] @ corpus_t
+        if adjust is not None:
+            adjust(start, stop, block)
+        indices[start:stop], scores[start:stop] = select_topk(block, k)
+    return indices, scores
@@ -0,0 +1,298 @@
+"""xlsx_patch.py
+Write cell values into a copy of an .xlsx file without re-serializing it.
+
+Only the worksheet parts that receive values are rewritten, plus
+``styles.xml`` when cells need the General number format and ``workbook.xml``
+to request a recalculation on open. Every other part (untouched sheets,
+shared strings, drawings, macros) is copied unchanged. Inside a sheet only
+the target rows are edited; the rest of ``sheetData`` is spliced through as
+bytes. Strings are written inline, so the shared string table is not rebuilt.
+
+:func:`patch_workbook` raises :class:`UnpatchableWorkbook` for layouts it
+does not handle (e.g. rows or cells without an ``r`` reference, prefixed
+SpreadsheetML). Callers fall back to openpyxl in that case.
+"""
+
+import math
+import numbers
+import os
+import posixpath
+import re
+import zipfile
+from bisect import bisect_left
+from xml.etree import ElementTree
+
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+SHEET_DATA_RE = re.compile(rb"<sheetData\s*/>|<sheetData\b[^>]*>")
+ROW_RE = re.compile(rb"<row\b([^>]*?)(?:/>|>(.*?)</row>)", re.S)
+CELL_RE = re.compile(rb"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+REF_RE = re.compile(rb'\br="([A-Z]*)(\d+)"')
+STYLE_RE = re.compile(rb'\bs="(\d+)"')
+SPANS_RE = re.compile(rb'\s+spans="[^"]*"')
+DIMENSION_RE = re.compile(rb'<dimension\s+ref="([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?"\s*/>')
+CELL_XFS_RE = re.compile(rb"<cellXfs\b([^>]*)>(.*?)</cellXfs>", re.S)
+XF_RE = re.compile(rb"<xf\b[^>]*?(?:/>|>.*?</xf>)", re.S)
+CALC_PR_RE = re.compile(rb"<calcPr\b([^>]*?)\s*(?:/>|>\s*</calcPr>)")
+
+
+class UnpatchableWorkbook(Exception):
+    """The workbook uses a layout the patcher does not edit in place."""
+
+
+def _escape(text: str) -> bytes:
+    text = ILLEGAL_CHARACTERS_RE.sub("", text)
+    text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return text.encode("utf-8")
+
+
+def _cell_xml(ref: bytes, style: bytes, value) -> bytes:
+    attrs = b'<c r="' + ref + b'"' + (b' s="' + style + b'"' if style else b"")
+    if value is None:
+        return attrs + b"/>"
+    if isinstance(value, bool):
+        return attrs + b' t="b"><v>' + (b"1" if value else b"0") + b"</v></c>"
+    if isinstance(value, numbers.Integral):
+        return attrs + b"><v>" + str(int(value)).encode("ascii") + b"</v></c>"
+    if isinstance(value, numbers.Real) and math.isfinite(value):
+        return attrs + b"><v>" + repr(float(value)).encode("ascii") + b"</v></c>"
+    if isinstance(value, str):
+        return (attrs + b' t="inlineStr"><is><t xml:space="preserve">'
+                + _escape(value) + b"</t></is></c>")
+    raise UnpatchableWorkbook(f"Unsupported cell value type {type(value).__name__}")
+
+
+class _Styles:
+    """Lazily adds General-format copies of cell formats to ``styles.xml``."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.general = {}
+        self.added = []
+        match = CELL_XFS_RE.search(data) if data else None
+        self.xfs = XF_RE.findall(match.group(2)) if match else []
+
+    def general_style(self, style: int) -> int:
+        if style not in self.general:
+            if style >= len(self.xfs):
+                raise UnpatchableWorkbook(f"Unknown cell style {style}")
+            xf = self.xfs[style]
+            fmt = re.search(rb'\bnumFmtId="(\d+)"', xf)
+            if fmt is None or fmt.group(1) == b"0":
+                self.general[style] = style
+            else:
+                head_end = xf.index(b">")
+                head = xf[:head_end].rstrip(b"/")
+                head = re.sub(rb'\s+(numFmtId|applyNumberFormat)="[^"]*"', b"", head)
+                head += b' numFmtId="0" applyNumberFormat="1"'
+                self.added.append(head + xf[head_end:].lstrip(b"/") if xf.endswith(b"</xf>")
+                                  else head + b"/>")
+                self.general[style] = len(self.xfs) + len(self.added) - 1
+        return self.general[style]
+
+    def patched(self) -> bytes:
+        match = CELL_XFS_RE.search(self.data)
+        attrs = re.sub(rb'\s+count="\d+"', b"", match.group(1))
+        count = str(len(self.xfs) + len(self.added)).encode("ascii")
+        block = (b'<cellXfs count="' + count + b'"' + attrs + b">"
+                 + match.group(2) + b"".join(self.added) + b"</cellXfs>")
+        return self.data[: match.start()] + block + self.data[match.end():]
+
+
+def _patch_row(attrs: bytes, inner: bytes, row: int, values: dict, general: set, styles) -> bytes:
+    """Return the row element with ``values`` ({col: value}) merged into its cells."""
+    cells = []  # (col, match)
+    for match in CELL_RE.finditer(inner or b""):
+        ref = REF_RE.search(match.group(1))
+        if ref is None:
+            raise UnpatchableWorkbook("Cell without an r reference")
+        cells.append((column_index_from_string(ref.group(1).decode("ascii")), match))
+
+    out = []
+    targets = sorted(values.items())
+    ti = 0
+    for col, match in cells:
+        while ti < len(targets) and targets[ti][0] < col:
+            out.append(_new_cell(row, *targets[ti], b"", general, styles))
+            ti += 1
+        if ti < len(targets) and targets[ti][0] == col:
+            style = STYLE_RE.search(match.group(1))
+            out.append(_new_cell(row, *targets[ti], style.group(1) if style else b"",
+                                 general, styles))
+            ti += 1
+        else:
+            out.append(match.group(0))
+    for target in targets[ti:]:
+        out.append(_new_cell(row, *target, b"", general, styles))
+    return b"<row" + SPANS_RE.sub(b"", attrs) + b">" + b"".join(out) + b"</row>"
+
+
+def _new_cell(row: int, col: int, value, style: bytes, general: set, styles) -> bytes:
+    if col in general:
+        style = str(styles.general_style(int(style or 0))).encode("ascii")
+    ref = f"{get_column_letter(col)}{row}".encode("ascii")
+    return _cell_xml(ref, style, value)
+
+
+def _patch_sheet(data: bytes, values: dict, general: set, styles) -> bytes:
+    """Return sheet XML with ``values`` ({(row, col): value}) written in."""
+    by_row = {}
+    for (row, col), value in values.items():
+        by_row.setdefault(row, {})[col] = value
+    general_by_row = {}
+    for row, col in general:
+        general_by_row.setdefault(row, set()).add(col)
+
+    match = SHEET_DATA_RE.search(data)
+    if match is None:
+        raise UnpatchableWorkbook("No sheetData element")
+    prefix = data[: match.start()]
+    if match.group(0).endswith(b"/>"):
+        open_tag, body, suffix = b"<sheetData>", b"", data[match.end():]
+    else:
+        end = data.index(b"</sheetData>", match.end())
+        open_tag, body = match.group(0), data[match.end(): end]
+        suffix = data[end + len(b"</sheetData>"):]
+
+    rows = []  # (row number, match)
+    for row_match in ROW_RE.finditer(body):
+        ref = re.search(rb'\br="(\d+)"', row_match.group(1))
+        if ref is None:
+            raise UnpatchableWorkbook("Row without an r reference")
+        number = int(ref.group(1))
+        if rows and number <= rows[-1][0]:
+            raise UnpatchableWorkbook("Rows out of order")
+        rows.append((number, row_match))
+    row_numbers = [number for number, _ in rows]
+
+    pieces = []
+    pos = 0
+    for row in sorted(by_row):
+        i = bisect_left(row_numbers, row)
+        if i < len(rows) and row_numbers[i] == row:
+            row_match = rows[i][1]
+            pieces.append(body[pos: row_match.start()])
+            pieces.append(_patch_row(row_match.group(1), row_match.group(2), row,
+                                     by_row[row], general_by_row.get(row, ()), styles))
+            pos = row_match.end()
+        else:
+            insert_at = rows[i][1].start() if i < len(rows) else len(body)
+            pieces.append(body[pos:insert_at])
+            pieces.append(_patch_row(f' r="{row}"'.encode("ascii"), b"", row,
+                                     by_row[row], general_by_row.get(row, ()), styles))
+            pos = insert_at
+    pieces.append(body[pos:])
+
+    max_row = max(by_row)
+    max_col = max(col for _, col in values)
+    prefix = DIMENSION_RE.sub(lambda m: _dimension(m, max_row, max_col), prefix, count=1)
+    return prefix + open_tag + b"".join(pieces) + b"</sheetData>" + suffix
+
+
+def _dimension(match, max_row: int, max_col: int) -> bytes:
+    first_col, first_row, last_col, last_row = match.groups()
+    last_col = max(column_index_from_string((last_col or first_col).decode("ascii")), max_col)
+    last_row = max(int(last_row or first_row), max_row)
+    return (b'<dimension ref="' + first_col + first_row + b":"
+            + f"{get_column_letter(last_col)}{last_row}".encode("ascii") + b'"/>')
+
+
+def _resolve(base_part: str, target: str) -> str:
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+
+def _rels_path(part: str) -> str:
+    return posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+
+
+def _relationships(zin: zipfile.ZipFile, part: str) -> dict:
+    root = ElementTree.fromstring(zin.read(_rels_path(part)))
+    return {
+        rel.get("Id"): (rel.get("Type", ""), _resolve(part, rel.get("Target", "")))
+        for rel in root.iter(f"{{{PKG_REL_NS}}}Relationship")
+    }
+
+
+def _workbook_parts(zin: zipfile.ZipFile) -> tuple:
+    """Return ``(workbook part, styles part, {sheet title: worksheet part})``."""
+    workbook = next(
+        (target for kind, target in _relationships(zin, "").values()
+         if kind.endswith("/officeDocument")),
+        None,
+    )
+    if workbook is None:
+        raise UnpatchableWorkbook("No workbook part")
+    rels = _relationships(zin, workbook)
+    root = ElementTree.fromstring(zin.read(workbook))
+    sheets = {}
+    for sheet in root.iter(f"{{{MAIN_NS}}}sheet"):
+        kind, target = rels.get(sheet.get(f"{{{REL_NS}}}id"), ("", None))
+        if kind.endswith("/worksheet"):
+            sheets[sheet.get("name")] = target
+    styles = next((target for kind, target in rels.values() if kind.endswith("/styles")), None)
+    return workbook, styles, sheets
+
+
+def _full_calc_on_load(data: bytes) -> bytes:
+    """Ask Excel to recalculate formulas that depend on the written cells."""
+    match = CALC_PR_RE.search(data)
+    if match:
+        attrs = re.sub(rb'\s+fullCalcOnLoad="[^"]*"', b"", match.group(1))
+        return data[: match.start()] + b"<calcPr" + attrs + b' fullCalcOnLoad="1"/>' + data[match.end():]
+    # calcPr follows these elements when present (CT_Workbook sequence)
+    for tag in (b"</definedNames>", b"<definedNames/>", b"<definedNames />",
+                b"</externalReferences>", b"</functionGroups>", b"<functionGroups/>", b"</sheets>"):
+        at = data.rfind(tag)
+        if at >= 0:
+            at += len(tag)
+            return data[:at] + b'<calcPr fullCalcOnLoad="1"/>' + data[at:]
+    raise UnpatchableWorkbook("No sheets element in workbook")
+
+
+def patch_workbook(src_path: str, dst_path: str, cells: dict, general_cells=()) -> None:
+    """Copy ``src_path`` to ``dst_path`` with ``cells`` written in.
+
+    ``cells`` maps sheet titles to ``{(row, col): value}`` with str, int,
+    float, bool or None values. Cells listed in ``general_cells`` as
+    ``(sheet_title, row, col)`` also get the General number format.
+    """
+    general = {}
+    for title, row, col in general_cells:
+        general.setdefault(title, set()).add((row, col))
+
+    try:
+        with zipfile.ZipFile(src_path) as zin:
+            workbook, styles_part, sheets = _workbook_parts(zin)
+            styles = _Styles(zin.read(styles_part) if styles_part else b"")
+            patched = {}
+            for title, values in cells.items():
+                if not values:
+                    continue
+                if title not in sheets:
+                    raise UnpatchableWorkbook(f"No worksheet part for '{title}'")
+                patched[sheets[title]] = _patch_sheet(
+                    zin.read(sheets[title]), values, general.get(title, set()), styles
+                )
+            if styles.added:
+                patched[styles_part] = styles.patched()
+            patched[workbook] = _full_calc_on_load(zin.read(workbook))
+
+            tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+            try:
+                with zipfile.ZipFile(tmp_path, "w") as zout:
+                    for info in zin.infolist():
+                        data = patched.get(info.filename)
+                        zout.writestr(info, zin.read(info) if data is None else data)
+                os.replace(tmp_path, dst_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    except (KeyError, ValueError, zipfile.BadZipFile, ElementTree.ParseError) as e:
+        raise UnpatchableWorkbook(str(e)) from e
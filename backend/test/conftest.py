@@ -0,0 +1,27 @@
+"""Shared fixtures for the Python service tests; run ``python -m pytest backend/test``."""
+
+import os
+import sys
+
+import pytest
+
+# The services import each other by module name, as when run from src/services
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "services"))
+
+from fake_embedding_server import serve  # noqa: E402
+
+
+@pytest.fixture
+def fake_server():
+    """Start fake embedding servers on free ports; returns a ``start(latency, rate_limit)`` -> URL."""
+    servers = []
+
+    def start(latency=0.0, rate_limit=None):
+        server = serve(0, latency, rate_limit)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,83 @@
+"""Tests for embedding_scheduler against the local fake embedding server."""
+
+import random
+import threading
+import time
+import urllib.error
+
+import pytest
+
+from embedding_scheduler import TokenBucket, embed_batches, retry_after
+from fake_embedding_server import embed_texts, fake_embedding
+
+
+def make_batches(count, size=3):
+    return [[f"item {b}-{i}" for i in range(size)] for b in range(count)]
+
+
+def test_results_keep_batch_order_with_concurrent_requests(fake_server):
+    url = fake_server()
+    rng = random.Random(0)
+    in_flight = [0, 0]  # current, peak
+    lock = threading.Lock()
+
+    def embed(batch):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight[1], in_flight[0])
+        try:
+            time.sleep(rng.uniform(0, 0.05))  # Finish in a shuffled order
+            return embed_texts(url, batch, 8)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    batches = make_batches(20)
+    results = embed_batches(batches, embed, concurrency=4, requests_per_second=1000)
+
+    assert results == [[fake_embedding(t, 8) for t in batch] for batch in batches]
+    assert in_flight[1] > 1
+
+
+def test_429_retry_after_is_honoured(fake_server):
+    url = fake_server(rate_limit=2)  # Third request in a second gets 429, Retry-After: 1
+    logs = []
+    batches = make_batches(4)
+    start = time.monotonic()
+    results = embed_batches(batches, lambda batch: embed_texts(url, batch, 8), logs.append,
+                            concurrency=2, requests_per_second=1000)
+    elapsed = time.monotonic() - start
+
+    assert results == [[fake_embedding(t, 8) for t in batch] for batch in batches]
+    assert any("rate limited; retrying in 1.0s" in msg for msg in logs)
+    assert elapsed >= 1.0
+
+
+def test_retry_after_reads_http_error_header(fake_server):
+    url = fake_server(rate_limit=1)
+    embed_texts(url, ["first"], 8)
+    with pytest.raises(urllib.error.HTTPError) as info:
+        embed_texts(url, ["second"], 8)
+    assert info.value.code == 429
+    assert retry_after(info.value) == 1.0
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(20.0, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.acquire()
+    # One token up front, then one every 1/20 s
+    assert time.monotonic() - start >= 0.45
+
+
+def test_token_bucket_throttle_pauses_and_halves_rate():
+    bucket = TokenBucket(20.0)
+    bucket.acquire()
+    bucket.throttle(0.3)
+    assert bucket.rate == 10.0
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.3
+    bucket.succeeded()
+    assert bucket.rate == pytest.approx(11.0)
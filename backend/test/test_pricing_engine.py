@@ -0,0 +1,47 @@
+"""Tests for pricing_engine's rate application and compiled rate cache."""
+
+import itertools
+
+import pricing_engine
+from pricing_engine import RateTable, apply_rates, apply_rates_batch
+
+VALUES = [None, "", "n/a", "12.5", 3, 0]
+
+
+def without_timestamps(result):
+    return {**result, "overrides": [{k: v for k, v in o.items() if k != "timestamp"}
+                                    for o in result["overrides"]]}
+
+
+def test_batch_matches_apply_rates_on_non_numeric_values():
+    table = RateTable.from_dict({"A1": {"rate": 10.0, "cost": 6.0}, "B2": {"rate": 4.0, "cost": 0.0}})
+    boq = [
+        {"code": code, "qty": qty, "unit_rate": unit_rate}
+        for code, qty, unit_rate in itertools.product(["A1", "B2", "ZZ"], VALUES, VALUES)
+    ]
+
+    expected = apply_rates(boq, table.to_dict())
+    result = apply_rates_batch(boq, table)
+
+    assert without_timestamps(result) == without_timestamps(expected)
+    assert any(item["total"] is None for item in result["items"])
+    assert result["total"] == sum(i["total"] for i in expected["items"] if i["total"] is not None)
+
+
+def test_bad_quantity_leaves_only_that_item_unpriced():
+    table = RateTable.from_dict({"A1": {"rate": 10.0, "cost": 6.0}})
+    result = apply_rates_batch([{"code": "A1", "qty": ""}, {"code": "A1", "qty": "2"}], table)
+
+    assert [item["total"] for item in result["items"]] == [None, 20.0]
+    assert result["total"] == 20.0
+
+
+def test_unwritable_rate_cache_still_prices(tmp_path, monkeypatch, capsys):
+    blocker = tmp_path / "not-a-dir"
+    blocker.write_text("")
+    monkeypatch.setattr(pricing_engine, "RATE_CACHE_DIR", str(blocker))
+    rates_csv = tmp_path / "rates.csv"
+    rates_csv.write_text("code,rate,cost\nA1,10,6\n")
+
+    assert pricing_engine.load_rates(str(rates_csv)) == {"A1": {"rate": 10.0, "cost": 6.0}}
+    assert "Could not write rate cache" in capsys.readouterr().err
@@ -0,0 +1,34 @@
+"""Tests for pricing_worker's request handling and response encoding."""
+
+import json
+from datetime import date
+
+import numpy as np
+
+import pricing_worker
+
+
+def call(monkeypatch, result):
+    monkeypatch.setitem(pricing_worker.METHODS, "echo", lambda params: result)
+    return json.loads(pricing_worker.respond_line('{"id": 7, "method": "echo"}'))
+
+
+def test_nan_and_infinity_are_sent_as_null(monkeypatch):
+    response = call(monkeypatch, {"total": float("nan"), "items": [{"margin": np.float32("inf")}]})
+    assert response == {"id": 7, "result": {"total": None, "items": [{"margin": None}]}}
+
+
+def test_numpy_scalars_and_dates_are_encoded(monkeypatch):
+    response = call(monkeypatch, {"rate": np.float64(2.5), "n": np.int64(3), "on": date(2024, 5, 1)})
+    assert response["result"] == {"rate": 2.5, "n": 3, "on": "2024-05-01"}
+
+
+def test_unencodable_result_answers_with_an_error(monkeypatch):
+    response = call(monkeypatch, {"items": {1, 2}})
+    assert response["id"] == 7
+    assert "not JSON serializable" in response["error"]
+
+
+def test_non_object_request_answers_with_an_error():
+    response = json.loads(pricing_worker.respond_line("[1, 2]"))
+    assert response == {"id": None, "error": "Invalid request: expected a JSON object"}
@@ -0,0 +1,37 @@
+"""Golden-corpus tests for text_normalizer."""
+
+import json
+
+import pytest
+
+import text_normalizer
+from text_normalizer import GOLDEN_PATH, _reference_normalize, normalize_text, normalize_texts
+
+
+@pytest.fixture(scope="module")
+def golden():
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        return [tuple(case) for case in json.load(f)]
+
+
+def mismatches(cases, outputs):
+    return [(text, expected, got) for (text, expected), got in zip(cases, outputs) if got != expected]
+
+
+def test_golden_corpus_is_loaded(golden):
+    assert len(golden) >= 685
+
+
+def test_normalize_texts_matches_golden(golden):
+    text_normalizer._memo.clear()
+    assert mismatches(golden, normalize_texts([text for text, _ in golden])) == []
+
+
+def test_normalize_text_matches_golden_with_warm_memo(golden):
+    # Second pass: every token is answered from the memo
+    outputs = [normalize_text(text) for text, _ in golden]
+    assert mismatches(golden, outputs) == []
+
+
+def test_reference_pipeline_matches_golden(golden):
+    assert mismatches(golden, [_reference_normalize(text) for text, _ in golden]) == []
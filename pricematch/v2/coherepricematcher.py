@@ -2,12 +2,21 @@ import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 import cohere
 import numpy as np
-from openpyxl import load_workbook
 import os
 import threading
 from datetime import datetime
 import re
-from rapidfuzz import fuzz
+import sys
+from rapidfuzz import fuzz, process
+
+# Shared search helpers live with the backend matchers
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "backend", "src", "services"))
+from embedding_providers import CohereProvider
+from inquiry_io import result_columns, scan_inquiry, write_inquiry
+from parallel_ingest import ingest_workbook
+from tk_log import TkLog
+from topk_search import topk_similarity
 
 # --- CONFIGURABLE CONSTANTS ---
 EMBEDDING_MODEL = "embed-v4.0"
@@ -15,6 +24,7 @@ EMBEDDING_BATCH_SIZE = 96        # Cohere supports up to 96 texts per embed call
 EMBEDDING_DIMENSION = 1536       # Choose from 256, 512, 1024, or 1536
 FUZZY_THRESHOLD = 0.4            # Embedding score threshold to trigger fuzzy-text fallback
 FALLBACK_CANDIDATES = 5          # Number of top embedding candidates for fuzzy re-rank
+FUZZY_WORKERS = -1               # Threads for bulk fuzzy scoring (-1: all cores)
 
 class PricelistMatcherApp:
     def __init__(self, root):
@@ -71,19 +81,13 @@ class PricelistMatcherApp:
         tk.Label(frm, text="Progress:").grid(row=5, column=0, sticky="nw", pady=(10,0))
         self.log_box = scrolledtext.ScrolledText(frm, width=85, height=14, state="disabled", wrap=tk.WORD)
         self.log_box.grid(row=5, column=1, columnspan=2, pady=(10,0))
+        self.log = TkLog(self.root, self.log_box)
 
         # Process button
         self.process_btn = tk.Button(frm, text="Process", command=self.on_process_thread,
                                      bg="#4CAF50", fg="white", width=14)
         self.process_btn.grid(row=6, column=1, pady=12, sticky="w")
 
-    def log(self, msg):
-        self.log_box.config(state="normal")
-        self.log_box.insert(tk.END, msg + "\n")
-        self.log_box.see(tk.END)
-        self.log_box.config(state="disabled")
-        self.root.update_idletasks()
-
     def get_auto_output_path(self):
         folder = self.output_folder.get()
         if not folder:
@@ -120,13 +124,14 @@ class PricelistMatcherApp:
             texts, descs, rates, cats, subs = load_pricelist_data(
                 self.pricelist_path.get(), self.log, self.use_taxonomy.get()
             )
-            wb_inq, items_to_fill, header_rows = load_inquiry_data(
+            items_to_fill, header_rows = load_inquiry_data(
                 self.inquiry_path.get(), self.log
             )
 
-            fill_inquiry_rates(
-                client=self.client,
-                wb_inq=wb_inq,
+            provider = CohereProvider(self.client, EMBEDDING_MODEL, EMBEDDING_DIMENSION,
+                                      EMBEDDING_BATCH_SIZE)
+            cells, general_cells = fill_inquiry_rates(
+                provider=provider,
                 items_to_fill=items_to_fill,
                 pricelist_texts=texts,
                 pricelist_simple_descs=descs,
@@ -134,15 +139,13 @@ class PricelistMatcherApp:
                 pricelist_cats=cats,
                 pricelist_subs=subs,
                 header_rows=header_rows,
-                model=EMBEDDING_MODEL,
                 logger_fn=self.log,
                 use_fuzzy=self.use_fuzzy.get(),
                 use_taxonomy=self.use_taxonomy.get()
             )
+            self.log(provider.metrics_line())
 
-            self.log(f"Saving output file as: {output_path}")
-            wb_inq.save(output_path)
-            wb_inq.close()
+            write_inquiry(self.inquiry_path.get(), output_path, cells, self.log, general_cells)
             self.log("Output file saved.")
             messagebox.showinfo("Success", f"Pricing completed.\nOutput saved to:\n{output_path}")
         except Exception as e:
@@ -162,143 +165,118 @@ def preprocess_text(s):
     s = s.replace("r.c.c.", "rcc").replace("reinforced cement concrete", "rcc")
     return s
 
+def pricelist_header(title, head, include_taxonomy, logger_fn):
+    cat_idx = sub_idx = None
+    for r, row_vals in enumerate(head, start=1):
+        cleaned = [str(v).strip().lower() if isinstance(v, str) else "" for v in row_vals]
+        if "description" in cleaned and "rate" in cleaned:
+            desc_idx = cleaned.index("description")
+            rate_idx = cleaned.index("rate")
+            if include_taxonomy:
+                cat_idx = cleaned.index("category") if "category" in cleaned else None
+                sub_idx = cleaned.index("subcategory") if "subcategory" in cleaned else None
+            headers = [str(v).strip() if v is not None else f"col{ci}" for ci, v in enumerate(row_vals)]
+            return r + 1, (headers, desc_idx, rate_idx, cat_idx, sub_idx)
+    logger_fn(f"  → Skipping '{title}': no Description/Rate headers.")
+    return None
+
+def pricelist_row(rv, header):
+    headers, desc_idx, rate_idx, cat_idx, sub_idx = header
+    raw_desc = rv[desc_idx]
+    raw_rate = rv[rate_idx]
+    if not raw_desc or raw_rate in (None, "", 0):
+        return None
+    parts = [f"{h}: {v}" for h, v in zip(headers, rv) if v not in (None, "")]
+    ctx = " | ".join(parts)
+    return (
+        preprocess_text(ctx),
+        str(raw_desc).strip(),
+        float(raw_rate),
+        rv[cat_idx] if cat_idx is not None else None,
+        rv[sub_idx] if sub_idx is not None else None,
+    )
+
 def load_pricelist_data(pricelist_path, logger_fn, include_taxonomy):
     logger_fn("Reading pricelist file...")
-    wb_price = load_workbook(pricelist_path, read_only=True, data_only=True)
-    texts, descs, rates, cats, subs = [], [], [], [], []
-    for sheet in wb_price.worksheets:
-        logger_fn(f"Processing pricelist sheet '{sheet.title}'...")
-        num_cols = sheet.max_column
-        desc_idx = rate_idx = cat_idx = sub_idx = None
-        header_row_idx = None
-        for r in range(1, 6):
-            row_vals = next(sheet.iter_rows(min_row=r, max_row=r, max_col=num_cols, values_only=True))
-            cleaned = [str(v).strip().lower() if isinstance(v, str) else "" for v in row_vals]
-            if "description" in cleaned and "rate" in cleaned:
-                desc_idx = cleaned.index("description")
-                rate_idx = cleaned.index("rate")
-                if include_taxonomy:
-                    cat_idx = cleaned.index("category") if "category" in cleaned else None
-                    sub_idx = cleaned.index("subcategory") if "subcategory" in cleaned else None
-                header_row_idx = r
-                headers = [str(v).strip() if v is not None else f"col{ci}" for ci, v in enumerate(row_vals)]
-                break
-        if header_row_idx is None:
-            logger_fn(f"  → Skipping '{sheet.title}': no Description/Rate headers.")
-            continue
-        for rv in sheet.iter_rows(min_row=header_row_idx+1, max_row=sheet.max_row, max_col=num_cols, values_only=True):
-            raw_desc = rv[desc_idx]
-            raw_rate = rv[rate_idx]
-            if not raw_desc or raw_rate in (None, "", 0):
-                continue
-            parts = [f"{h}: {v}" for h, v in zip(headers, rv) if v not in (None, "")]  
-            ctx = " | ".join(parts)
-            texts.append(preprocess_text(ctx))
-            descs.append(str(raw_desc).strip())
-            rates.append(float(raw_rate))
-            cats.append(rv[cat_idx] if include_taxonomy and cat_idx is not None else None)
-            subs.append(rv[sub_idx] if include_taxonomy and sub_idx is not None else None)
-        logger_fn(f"  → Loaded {len(rates)} total items so far…")
-    wb_price.close()
+    # Sheets are split into row ranges parsed and preprocessed on a process pool
+    rows = ingest_workbook(
+        pricelist_path,
+        lambda title, head: pricelist_header(title, head, include_taxonomy, logger_fn),
+        pricelist_row,
+        logger_fn,
+    )
+    texts, descs, rates, cats, subs = (list(col) for col in zip(*rows)) if rows else ([], [], [], [], [])
     if not rates:
         raise RuntimeError("No item descriptions with rates found in pricelist file.")
     logger_fn(f"Total loaded pricelist items: {len(rates)}")
     return texts, descs, rates, cats, subs
 
 def load_inquiry_data(inquiry_path, logger_fn):
-    logger_fn("Reading inquiry file...")
-    wb_inq = load_workbook(inquiry_path, read_only=False, data_only=False)
-    items_to_fill, header_rows = [], {}
-    for sheet in wb_inq.worksheets:
-        logger_fn(f"Scanning inquiry sheet '{sheet.title}' for headers...")
-        desc_col = rate_col = qty_col = None
-        hdr_row = None
-        for r in range(1, 11):
-            for c in range(1, sheet.max_column+1):
-                v = sheet.cell(row=r, column=c).value
-                if isinstance(v, str):
-                    low = v.strip().lower()
-                    if low == "description": desc_col = c
-                    elif low == "rate": rate_col = c
-                    elif low in ("qty", "quantity"): qty_col = c
-            if desc_col and rate_col:
-                hdr_row = r
-                header_rows[sheet] = (hdr_row, desc_col, rate_col, qty_col)
-                break
-        if hdr_row:
-            for r in range(hdr_row+1, sheet.max_row+1):
-                desc_cell = sheet.cell(row=r, column=desc_col)
-                rate_cell = sheet.cell(row=r, column=rate_col)
-                qty_cell  = sheet.cell(row=r, column=qty_col) if qty_col else None
-                if not desc_cell.value or str(desc_cell.value).strip() == "": continue
-                if qty_col and (qty_cell.value is None or str(qty_cell.value).strip() == ""): continue
-                if rate_cell.value not in (None, ""): continue
-                items_to_fill.append((rate_cell, preprocess_text(str(desc_cell.value))))
-    if not items_to_fill:
-        raise RuntimeError("No inquiry items with empty rates found in the inquiry file.")
-    return wb_inq, items_to_fill, header_rows
+    return scan_inquiry(inquiry_path, preprocess_text, logger_fn)
+
+def fuzzy_rerank(query_texts, cand_idxs, cand_sims, descs):
+    """Re-rank embedding candidates with token-sort fuzzy scores, all rows at once.
 
-def get_embeddings(client, texts, model, logger_fn, input_type="search_document"):
-    embs = []
-    for i in range(0, len(texts), EMBEDDING_BATCH_SIZE):
-        batch = texts[i:i + EMBEDDING_BATCH_SIZE]
-        logger_fn(f"Requesting batch {i//EMBEDDING_BATCH_SIZE + 1} from Cohere...")
-        resp = client.embed(
-            texts=batch,
-            model=model,
-            input_type=input_type,
-            output_dimension=EMBEDDING_DIMENSION,
-            embedding_types=["float"]
-        )
-        embs.extend(resp.embeddings.float)
-        logger_fn("Received embeddings from Cohere.")
-    return np.array(embs)
+    ``cand_idxs``/``cand_sims`` hold each row's candidates best first. Returns
+    the chosen pricelist index and blended score per row.
+    """
+    n, k = cand_idxs.shape
+    # One (query, candidate) pair per cell, scored in bulk on worker threads
+    fuzzy = process.cpdist(
+        [text for text in query_texts for _ in range(k)],
+        [descs[j] for j in cand_idxs.ravel()],
+        scorer=fuzz.token_sort_ratio, workers=FUZZY_WORKERS,
+    ).reshape(n, k) / 100.0
+    combined = 0.7 * cand_sims + 0.3 * fuzzy
+    pick = combined.argmax(axis=1)
+    rows = np.arange(n)
+    return cand_idxs[rows, pick], combined[rows, pick]
 
-def fill_inquiry_rates(client, wb_inq, items_to_fill,
+def fill_inquiry_rates(provider, items_to_fill,
                        pricelist_texts, pricelist_simple_descs, pricelist_rates,
                        pricelist_cats, pricelist_subs, header_rows,
-                       model, logger_fn, use_fuzzy, use_taxonomy):
-    for sheet, (hdr, _, _, _) in header_rows.items():
-        base = sheet.max_column
-        sheet.cell(row=hdr, column=base+1, value="Matched Description")
-        sheet.cell(row=hdr, column=base+2, value="Similarity Score")
-        if use_taxonomy:
-            sheet.cell(row=hdr, column=base+3, value="Category")
-            sheet.cell(row=hdr, column=base+4, value="SubCategory")
+                       logger_fn, use_fuzzy, use_taxonomy):
+    labels = ["Matched Description", "Similarity Score"]
+    if use_taxonomy:
+        labels += ["Category", "SubCategory"]
+    cells, matched_cols = result_columns(header_rows, labels)
+    general_cells = []
     logger_fn("Computing embeddings for pricelist items...")
-    pl_embeds = get_embeddings(client, pricelist_texts, model, logger_fn, input_type="search_document")
+    pl_embeds = provider.get(pricelist_texts, "search_document", logger_fn)
     logger_fn("Computing embeddings for inquiry descriptions...")
     in_texts = [desc for _, desc in items_to_fill]
-    in_embeds = get_embeddings(client, in_texts, model, logger_fn, input_type="search_query")
+    # Each distinct description is embedded once, and reused across runs
+    in_embeds = provider.get(in_texts, "search_query", logger_fn)
     pl_unit = pl_embeds / np.linalg.norm(pl_embeds, axis=1, keepdims=True)
     in_unit = in_embeds / np.linalg.norm(in_embeds, axis=1, keepdims=True)
-    sim_mat = in_unit.dot(pl_unit.T)
-    for idx, (rate_cell, _) in enumerate(items_to_fill):
-        sims = sim_mat[idx]
-        best_idx = int(sims.argmax())
-        best_score = float(sims[best_idx])
-        if use_fuzzy and best_score < FUZZY_THRESHOLD:
-            top_idxs = np.argsort(sims)[-FALLBACK_CANDIDATES:][::-1]
-            combined_scores = []
-            for j in top_idxs:
-                fuzzy_score = fuzz.token_sort_ratio(in_texts[idx], pricelist_simple_descs[j]) / 100.0
-                combined = 0.7 * sims[j] + 0.3 * fuzzy_score
-                combined_scores.append((combined, j))
-            best_score, best_idx = max(combined_scores, key=lambda x: x[0])
-            best_score = float(best_score)
+    # Keep only the best candidates per row; fuzzy fallback re-ranks them
+    k = FALLBACK_CANDIDATES if use_fuzzy else 1
+    top_idxs, top_sims = topk_similarity(in_unit, pl_unit, k)
+    best_idxs = top_idxs[:, 0].copy()
+    best_scores = top_sims[:, 0].astype(np.float64)
+    if use_fuzzy:
+        low = np.flatnonzero(best_scores < FUZZY_THRESHOLD)
+        if len(low):
+            logger_fn(f"Fuzzy re-ranking {len(low)} low-scoring rows...")
+            best_idxs[low], best_scores[low] = fuzzy_rerank(
+                [in_texts[i] for i in low], top_idxs[low], top_sims[low], pricelist_simple_descs)
+    for idx, ((title, row, rate_c), _) in enumerate(items_to_fill):
+        best_idx = int(best_idxs[idx])
+        best_score = float(best_scores[idx])
         best_desc = pricelist_simple_descs[best_idx]
         best_rate = float(pricelist_rates[best_idx])
-        sheet = rate_cell.parent
-        matched_c = sheet.max_column - (2 + (2 if use_taxonomy else 0)) + 1
+        sheet_cells = cells[title]
+        matched_c = matched_cols[title]
         score_c = matched_c + 1
-        rate_cell.value = best_rate
-        rate_cell.number_format = 'General'
-        sheet.cell(row=rate_cell.row, column=matched_c).value = best_desc
-        sheet.cell(row=rate_cell.row, column=score_c).value = round(best_score, 3)
+        sheet_cells[(row, rate_c)] = best_rate
+        general_cells.append((title, row, rate_c))
+        sheet_cells[(row, matched_c)] = best_desc
+        sheet_cells[(row, score_c)] = round(best_score, 3)
         if use_taxonomy:
-            sheet.cell(row=rate_cell.row, column=score_c+1).value = pricelist_cats[best_idx]
-            sheet.cell(row=rate_cell.row, column=score_c+2).value = pricelist_subs[best_idx]
+            sheet_cells[(row, score_c+1)] = pricelist_cats[best_idx]
+            sheet_cells[(row, score_c+2)] = pricelist_subs[best_idx]
     logger_fn("All items processed. Matches and rates filled in.")
+    return cells, general_cells
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -1,6 +1,6 @@
 #!/usr/bin/env bash
 # Setup script for the MJD Automation project
-# Checks for internet connectivity and installs Node.js dependencies
+# Checks for internet connectivity and installs Node.js and Python dependencies
 set -euo pipefail
 
 check_internet() {
@@ -27,6 +27,14 @@ install_dependencies() {
 
   echo "Installing frontend dependencies..."
   (cd client && npm install)
+
+  echo "Installing Python dependencies..."
+  if command -v python3 >/dev/null; then
+    python3 -m pip install -r backend/requirements.txt
+  else
+    echo "python3 not found; the pricing services need Python 3 with backend/requirements.txt." >&2
+    exit 1
+  fi
 }
 
 check_internet